@@ -17,15 +17,15 @@ import core.filefuncs as ff
 
 def make_report(report_data):
     report = ISection(name='report')
-    report = add_test_specs(report, **report_data)
+    report = add_test_specs(report, **report_data.args(add_test_specs))
     merged_df = report_data['merged_df']
     with report.new_section("APL' vs Power Charts", page_break=False) as apl_power:
         for test_name in merged_df['test_name'].unique():
             if 'standby' not in test_name:
-                apl_power = add_apl_power(apl_power, test_name, **report_data)
+                apl_power = add_apl_power(apl_power, test_name, **report_data.args(add_apl_power))
     filename = f'apl-power-charts.pdf'
     report_title = "APL' vs Power Charts All Tests"
-    build_report(report, filename, report_title=report_title, **report_data)
+    build_report(report, filename, report_title=report_title, **report_data.args(build_report))
     
     
 def main():
@@ -39,6 +39,7 @@ def main():
         'rsdf',
         'test_specs_df'
     ]
+    report_data.load(*expected_data)
     check_report_data(report_data, expected_data)
     make_report(report_data)
 
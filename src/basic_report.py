@@ -15,11 +15,11 @@ import core.filefuncs as ff
 
 def make_basic_report(report_data):
     report = ISection(name='report')
-    report = add_test_specs(report, **report_data)
-    report = add_test_results_table(report, **report_data)
-    report = add_test_results_plots(report, **report_data)
+    report = add_test_specs(report, **report_data.args(add_test_specs))
+    report = add_test_results_table(report, **report_data.args(add_test_results_table))
+    report = add_test_results_plots(report, **report_data.args(add_test_results_plots))
     report_name = f'basic-report.pdf'
-    build_report(report, report_name, **report_data)
+    build_report(report, report_name, **report_data.args(build_report))
     
     
 def main():
@@ -32,6 +32,7 @@ def main():
         'rsdf',
         'test_specs_df'
     ]
+    report_data.load(*expected_data)
     check_report_data(report_data, expected_data)
     make_basic_report(report_data)
     
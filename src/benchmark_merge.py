@@ -0,0 +1,193 @@
+"""Usage:
+benchmark_merge.py <data_folder> [options]
+
+Times each stage of merging a datalog with test sequence data on synthetic datalogs of different lengths
+and compares the timings with a saved baseline.
+
+Arguments:
+  data_folder       folder for the synthetic datalogs and benchmark results
+
+Options:
+  -h --help
+  --hours=<hours>     comma separated datalog lengths in hours [default: 1,8,48]
+  --hz=<hz>           datalog rows per second [default: 4]
+  --repeat=<n>        time each stage this many times and keep the fastest [default: 3]
+  --baseline=<path>   baseline results file [default: merge-benchmark-baseline.csv]
+  --save-baseline     save the results as the new baseline
+  --tolerance=<pct>   flag stages which are this many percent slower than the baseline [default: 20]
+"""
+import sys
+import time
+import logging
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import core.logfuncs as lf
+from core.config import get_config
+from core.report import merge
+from core.report.datalog import parse_datalog
+
+
+TESTS = ['screen_config', 'stabilization', 'camera_ccf_default', 'lum_profile', 'default', 'brightest', 'hdr10',
+         'default_100', 'brightest_100', 'standby_active_low', 'active_low_waketime', 'manual_ccf_default']
+# tests repeated (with new tags) until the datalog is long enough
+REPEATED_TESTS = ['default', 'brightest', 'hdr10', 'default_100', 'brightest_100', 'standby_active_low',
+                  'active_low_waketime']
+STAB_ITERATIONS = 3
+INTRO_SECONDS = 30
+REWIND_PROB = .1
+
+
+def make_test_seq_df(hours):
+    """Create a test sequence like the ones main_sequence.exe writes, long enough to fill hours of datalog."""
+    details = get_config('test_details').set_index('test_name')
+    test_names = list(TESTS)
+    seconds = sum(details['test_time'].reindex(test_names).fillna(0)) + 300 * STAB_ITERATIONS
+    cycle_seconds = sum(details['test_time'].reindex(REPEATED_TESTS).fillna(0)) + INTRO_SECONDS * len(REPEATED_TESTS)
+    while seconds < hours * 3600:
+        test_names += REPEATED_TESTS
+        seconds += cycle_seconds
+    test_seq_df = details.reindex(test_names).reset_index()
+    test_seq_df.insert(0, 'tag', np.arange(1, len(test_seq_df) + 1))
+    return test_seq_df
+
+
+def get_segments(test_seq_df, rng):
+    """Return the (tag, seconds) of each stretch of datalog rows, including stabilization iterations and rewinds."""
+    segments = []
+    previous = None
+    for _, row in test_seq_df.iterrows():
+        tag = row['tag']
+        if row['test_name'] == 'stabilization':
+            segments += [(f'{tag} stabilization {i}', 300) for i in range(1, STAB_ITERATIONS + 1)]
+        elif 'camera_ccf' in row['test_name']:
+            segments.append((f'{tag} camera ccf default', 30))
+        elif 'waketime' in row['test_name']:
+            segments += [(str(tag), 5), (f'{tag + .1} - user command', 8)]
+        else:
+            test_time = row['test_time'] if pd.notna(row['test_time']) else 60
+            if previous is not None and rng.random() < REWIND_PROB:
+                # operator stopped the test part way through and rewound to the previous test,
+                # so both tags are repeated later on and their earlier runs are discarded
+                segments += [(str(tag), int(rng.uniform(.1, .9) * test_time)), previous]
+            previous = (str(tag), int(test_time) + INTRO_SECONDS)
+            segments.append(previous)
+    return segments
+
+
+def make_datalog(path, hours, hz, seed=0):
+    """Write a synthetic datalog of hours of rows at about hz rows per second and return the test sequence."""
+    rng = np.random.default_rng(seed)
+    test_seq_df = make_test_seq_df(hours)
+    segments = get_segments(test_seq_df, rng)
+    n_rows = [int(seconds * hz) for _, seconds in segments]
+    tags = np.repeat([tag for tag, _ in segments], n_rows)[:int(hours * 3600 * hz)]
+    intervals = rng.uniform(.8 / hz, 1.2 / hz, len(tags))
+    timestamps = pd.Timestamp('2020-05-01 08:00:00') + pd.to_timedelta(np.cumsum(intervals), unit='s')
+    datalog_df = pd.DataFrame({
+        'Timestamp': timestamps.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3],
+        'Power': rng.normal(100, 5, len(tags)).round(3),
+        'Luminance': rng.normal(200, 10, len(tags)).round(3),
+        'Tag': tags,
+    })
+    datalog_df.to_csv(path, index=False)
+    return test_seq_df
+
+
+def get_stages(test_seq_df, datalog_path):
+    """Return (name, function) of each merge stage, each stage taking the output of the one before."""
+    def merge_on_tag(reduced_df):
+        stab_test_seq_df = merge.add_stab_tests(test_seq_df, reduced_df)
+        reduced_df = reduced_df.rename(columns={'Power': 'watts', 'Luminance': 'nits', 'Tag': 'tag'})
+        return reduced_df.merge(stab_test_seq_df, on='tag', how='left')
+
+    def add_waketimes(merged_df):
+        return merge.add_waketimes(merged_df, test_seq_df, tag_counts)
+
+    def normalize_tags(df):
+        df = df.copy()
+        df['Tag'] = merge.normalize_tags(df['Tag'])
+        tag_counts.update(df['Tag'].value_counts())
+        return df
+
+    tag_counts = {}
+    return [
+        ('parse_datalog (pandas)', lambda _: parse_datalog(datalog_path, engine='pandas')),
+        ('parse_datalog (pyarrow)', lambda _: parse_datalog(datalog_path)),
+        ('normalize_tags', normalize_tags),
+        ('remove_rows_rewind', merge.remove_rows_rewind),
+        ('resample_data', merge.resample_data),
+        ('clean_data', merge.clean_data),
+        ('merge_on_tag', merge_on_tag),
+        ('cut_off_intros', merge.cut_off_intros),
+        ('add_apl_data', merge.add_apl_data),
+        ('add_waketimes', add_waketimes),
+        ('merge_test_data', lambda _: merge.merge_test_data(test_seq_df, parse_datalog(datalog_path))),
+        ('merge_test_data_chunked', lambda _: merge.merge_test_data_chunked(test_seq_df, [datalog_path])),
+    ]
+
+
+def time_stage(func, data, repeat):
+    """Return the output of func(data), its fastest run time in seconds and its peak memory allocation in MB."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func(data)
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, min(seconds), peak / 2**20
+
+
+def run_benchmarks(data_folder, hours_list, hz, repeat):
+    results = []
+    for hours in hours_list:
+        datalog_path = Path(data_folder).joinpath(f'benchmark-{hours}h-{hz}hz-datalog.csv')
+        test_seq_df = make_datalog(datalog_path, hours, hz)
+        data = None
+        for stage, func in get_stages(test_seq_df, datalog_path):
+            # the parse and whole merge stages start from the file, the others from the previous stage's output
+            output, seconds, peak_mb = time_stage(func, data, repeat)
+            if stage != 'parse_datalog (pyarrow)' and not stage.startswith('merge_test_data'):
+                data = output
+            rows = len(output) if isinstance(output, pd.DataFrame) else None
+            results.append({'hours': hours, 'stage': stage, 'rows': rows, 'seconds': seconds, 'peak_mb': peak_mb})
+            logging.info(f'{hours}h {stage}: {seconds:.3f} s, {peak_mb:.1f} MB')
+    return pd.DataFrame(results)
+
+
+def compare_baseline(results_df, baseline_df, tolerance):
+    """Add each stage's time relative to the baseline and flag stages slower than the tolerance allows."""
+    baseline_df = baseline_df.set_index(['hours', 'stage'])[['seconds', 'peak_mb']].add_prefix('baseline_')
+    df = results_df.join(baseline_df, on=['hours', 'stage'])
+    df['ratio'] = df['seconds'] / df['baseline_seconds']
+    df['regression'] = df['ratio'] > 1 + tolerance / 100
+    return df
+
+
+def main():
+    logger, docopt_args, data_folder = lf.start_script(__doc__, 'benchmark_merge.log')
+    hours_list = [float(hours) for hours in docopt_args['--hours'].split(',')]
+    results_df = run_benchmarks(data_folder, hours_list, float(docopt_args['--hz']), int(docopt_args['--repeat']))
+
+    baseline_path = Path(docopt_args['--baseline'])
+    if not baseline_path.is_absolute():
+        baseline_path = Path(sys.path[0]).joinpath(baseline_path)
+    if baseline_path.exists():
+        results_df = compare_baseline(results_df, pd.read_csv(baseline_path), float(docopt_args['--tolerance']))
+    results_df.to_csv(Path(data_folder).joinpath('merge-benchmark.csv'), index=False)
+    print(results_df.to_string(index=False))
+
+    if docopt_args['--save-baseline']:
+        results_df[['hours', 'stage', 'rows', 'seconds', 'peak_mb']].to_csv(baseline_path, index=False)
+    elif 'regression' in results_df.columns and results_df['regression'].any():
+        regressions = results_df[results_df['regression']]
+        logger.warning(f'stages slower than the baseline:\n{regressions.to_string(index=False)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,10 +14,10 @@ import core.filefuncs as ff
 
 def make_compliance_report(report_data):
     report = ISection(name='report')
-    report = add_test_specs(report, **report_data)
-    report = add_compliance_section(report, **report_data)
+    report = add_test_specs(report, **report_data.args(add_test_specs))
+    report = add_compliance_section(report, **report_data.args(add_compliance_section))
     report_name = f'compliance-report.pdf'
-    build_report(report, report_name, **report_data)
+    build_report(report, report_name, **report_data.args(build_report))
             
             
 def main():
@@ -37,6 +37,7 @@ def main():
         'waketimes',
         'test_specs_df',
     ]
+    report_data.load(*expected_data)
     check_report_data(report_data, expected_data)
     make_compliance_report(report_data)
     
@@ -0,0 +1,57 @@
+"""
+Config files (in the config folder next to the executables), each read and validated once per process.
+Structures derived from them are memoized with memoize. Everything is read again after reload().
+Memoized values are shared so callers must not modify them.
+"""
+import sys
+from functools import wraps
+from pathlib import Path
+import pandas as pd
+
+
+CONFIG_DIR = 'config'
+# file name, read_csv options and the columns or index values each config file must have
+CONFIG_FILES = {
+    'test_details': ('test-details.csv', {}, {'columns': ['test_name', 'test_time', 'video', 'preset_picture']}),
+    'coeffs': ('coeffs.csv', {'index_col': 'coef'}, {'index': ['sf', 'a', 'b', 'c', 'd']}),
+    'power_cap_coeffs': ('power-cap-coeffs.csv', {'index_col': 'coef'}, {'index': ['sf', 'a', 'b']}),
+    'intro_text': ('intro-text.csv', {'index_col': 'section_path'}, {'columns': ['text']}),
+}
+# config files whose values must all be numbers
+NUMERIC_CONFIGS = ['coeffs', 'power_cap_coeffs']
+
+_cache = {}
+
+
+def memoize(func):
+    """Cache func's result for each set of arguments until reload is called."""
+    @wraps(func)
+    def wrapper(*args):
+        key = (func.__module__, func.__qualname__) + args
+        if key not in _cache:
+            _cache[key] = func(*args)
+        return _cache[key]
+    return wrapper
+
+
+def reload():
+    """Forget every config file and memoized structure so they are read again when next used."""
+    _cache.clear()
+
+
+def config_path(filename):
+    return Path(sys.path[0]).joinpath(f'{CONFIG_DIR}\\{filename}')
+
+
+@memoize
+def get_config(name):
+    """Return the contents of a config file, raising ValueError if it is missing required columns or values."""
+    filename, read_kwargs, required = CONFIG_FILES[name]
+    df = pd.read_csv(config_path(filename), **read_kwargs)
+    for axis, labels in required.items():
+        missing = [label for label in labels if label not in getattr(df, axis)]
+        if missing:
+            raise ValueError(f'{filename} is missing {axis} {missing}')
+    if name in NUMERIC_CONFIGS and not all(pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes):
+        raise ValueError(f'{filename} has values which are not numbers')
+    return df
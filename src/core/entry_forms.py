@@ -0,0 +1,78 @@
+"""
+Sheets of the entry forms workbook (entry-forms.xlsx), parsed once per version of the workbook and cached
+since Excel parsing is much slower than reading the cache.
+"""
+import pickle
+import logging
+import threading
+from functools import partial
+import pandas as pd
+from .filefuncs import get_cache_key, get_cache_path, replace_file
+
+
+SHEETS = ['PPS', 'Misc', 'Persistence Summary']
+CACHE_VERSION = 1
+CACHE_SUFFIX = '.pkl'
+
+# sheets of workbooks already read by this process keyed by workbook path
+_sheets = {}
+# one lock per workbook path so report items loaded on different threads parse and cache a workbook once
+_locks = {}
+
+
+def parse_workbook(path):
+    """Open the workbook once and parse each of SHEETS without headers."""
+    with pd.ExcelFile(path) as xlsx:
+        return {sheet: xlsx.parse(sheet, header=None) for sheet in SHEETS if sheet in xlsx.sheet_names}
+
+
+def load_cache(path, key):
+    """Return the cached sheets of a workbook or None if there is no up-to-date cache or it can't be read."""
+    cache_path = get_cache_path(path, CACHE_SUFFIX)
+    if not cache_path.exists():
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            cache = pickle.load(f)
+        return cache['sheets'] if cache['key'] == key else None
+    except Exception:
+        logging.exception(f'Could not load entry forms cache for {path}')
+        return None
+
+
+def save_cache(path, key, sheets):
+    replace_file(get_cache_path(path, CACHE_SUFFIX), partial(pickle.dump, {'key': key, 'sheets': sheets}))
+
+
+def read_sheets(path):
+    """
+    Return the unparsed sheets of the workbook, parsing the workbook only if it has changed since it was last
+    read by this process or cached.
+    """
+    with _locks.setdefault(str(path), threading.Lock()):
+        key = get_cache_key(path, CACHE_VERSION)
+        if key == _sheets.get(str(path), (None, None))[0]:
+            return _sheets[str(path)][1]
+        sheets = load_cache(path, key)
+        if sheets is None:
+            sheets = parse_workbook(path)
+            try:
+                save_cache(path, key, sheets)
+            except Exception:
+                logging.exception(f'Could not save entry forms cache for {path}')
+        _sheets[str(path)] = (key, sheets)
+        return sheets
+
+
+def read_sheet(path, sheet_name, header=0, index_col=None):
+    """Return a sheet of the workbook at path as pd.read_excel(path, sheet_name, header, index_col) would."""
+    df = read_sheets(path)[sheet_name]
+    if header is not None:
+        names = [f'Unnamed: {i}' if pd.isna(name) else name for i, name in enumerate(df.iloc[header])]
+        df = df.iloc[header + 1:].set_axis(names, axis=1)
+    df = df.reset_index(drop=True)
+    if index_col is not None:
+        df = df.set_index(df.columns[index_col])
+        if str(df.index.name).startswith('Unnamed: '):
+            df.index.name = None
+    return df.infer_objects()
@@ -1,6 +1,7 @@
 import shutil
 import os
 from datetime import datetime
+from hashlib import sha1
 from pathlib import Path
 from functools import partial
 import warnings
@@ -9,6 +10,35 @@ from .error_handling import permission_popup
 
 APPDATA_DIR = Path(os.environ['LOCALAPPDATA']).joinpath(r"DMC\TV Luminance Test System")
 APPDATA_DIR.mkdir(exist_ok=True, parents=True)
+CACHE_DIR = APPDATA_DIR.joinpath('cache')
+
+
+def get_cache_key(path, version):
+    """Return the values identifying a particular version of a file (cache version, path, size and mtime)."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    return [str(version), str(path), str(stat.st_size), str(stat.st_mtime_ns)]
+
+
+def get_cache_path(path, suffix):
+    """Return the location of the cache file (ending in suffix) for a file."""
+    path = Path(path).resolve()
+    digest = sha1(str(path).encode(encoding='UTF-8')).hexdigest()
+    return CACHE_DIR.joinpath(f'{path.stem}-{digest[:12]}{suffix}')
+
+
+def replace_file(path, write, mode='wb'):
+    """
+    Write a file by calling write with a temporary file opened with mode and swapping it in afterwards
+    so an interrupted write never leaves a partial file at path.
+    """
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
 
 @permission_popup
 def send_file(filepath, dst_folder_name, copy=True, date=True):
@@ -45,6 +75,7 @@ PATTERNS = {
     'test_metadata': '*test-metadata*.csv',
     'spectral_profile': '*viewing*.csv',
     'old_merged': '*merged*.csv',
+    'old_merged_tests': 'test-info.csv',
     'ccf': 'ccf-output.csv',
     'results_summary': 'results-summary.csv',
     'partial_test_seq': 'Partial/*partial-test-sequence*.csv',
@@ -56,12 +87,17 @@ PATTERNS = {
 }
 
 
+# every datalog in the data folder is kept (under 'datalogs', oldest first) since a test run
+# which was interrupted and resumed leaves one datalog per session
+SESSION_PATTERNS = {'datalogs': PATTERNS['test_data']}
+
+
 def get_paths(data_folder):
     def get_path(pattern):
         path_list = list(Path(data_folder).glob(pattern))
         if path_list:
             most_recent = max(path_list, key=lambda x: os.path.getmtime(x))
-            if len(path_list) > 1:
+            if len(path_list) > 1 and pattern not in SESSION_PATTERNS.values():
                 path_list.remove(most_recent)
                 for path in path_list:
                     archive(path, copy=False)
@@ -72,4 +108,8 @@ def get_paths(data_folder):
             return most_recent
 
     paths = {key: get_path(pattern) for key, pattern in PATTERNS.items()}
+    paths.update({
+        key: sorted(Path(data_folder).glob(pattern), key=lambda x: os.path.getmtime(x))
+        for key, pattern in SESSION_PATTERNS.items()
+    })
     return paths
\ No newline at end of file
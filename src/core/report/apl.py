@@ -0,0 +1,53 @@
+"""APL' and average R, G, B reference data for every clip with a table in config/apl."""
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .schema import read_apl_csv
+from ..config import memoize
+
+
+APL_DIR = r'config\apl'
+APL_COLS = ["APL'", 'R', 'G', 'B']
+# video names used in test-details.csv whose APL table is named differently
+APL_ALIASES = {
+    'clasp_hdr': 'clasp_hdr10',
+}
+
+
+class APLStore:
+    """
+    APL tables of all clips held in one array indexed by clip, second and column.
+    Clips shorter than the longest clip are padded with NaN.
+    """
+    def __init__(self, tables, aliases=None):
+        self.clips = pd.Index(list(tables) + list((aliases or {}).keys()))
+        clip_idx = {clip: i for i, clip in enumerate(tables)}
+        self.codes = np.array([clip_idx[clip] for clip in tables] + [clip_idx[clip] for clip in (aliases or {}).values()])
+        self.lengths = np.array([len(table) for table in tables.values()])
+        self.values = np.full((len(tables), max(self.lengths, default=0), len(APL_COLS)), np.nan, dtype=np.float32)
+        for i, table in enumerate(tables.values()):
+            self.values[i, table['seconds'].values] = table[APL_COLS].values
+
+    @classmethod
+    def from_folder(cls, folder, aliases=APL_ALIASES):
+        """Load every <clip>-APL.csv table in folder."""
+        tables = {path.stem[:-len('-APL')]: read_apl_csv(path) for path in sorted(Path(folder).glob('*-APL.csv'))}
+        return cls(tables, {alias: clip for alias, clip in aliases.items() if clip in tables})
+
+    def lookup(self, videos, seconds):
+        """Return the APL data of each (video, second) pair with NaN where the video or second has no data."""
+        seconds = np.asarray(seconds, dtype=float)
+        codes = self.clips.get_indexer(videos)
+        rows = np.flatnonzero(codes >= 0)
+        clip, seconds = self.codes[codes[rows]], seconds[rows]
+        found = (seconds >= 0) & (seconds < self.lengths[clip])
+        out = np.full((len(codes), len(APL_COLS)), np.nan, dtype=np.float32)
+        out[rows[found]] = self.values[clip[found], seconds[found].astype(int)]
+        return pd.DataFrame(out, columns=APL_COLS)
+
+
+@memoize
+def get_apl_store():
+    """Return the APL store, loading the APL tables the first time it is needed."""
+    return APLStore.from_folder(Path(sys.path[0]).joinpath(APL_DIR))
@@ -0,0 +1,187 @@
+"""
+Merge checkpoints record how much of a datalog has already been merged into merged.csv
+so that re-merging a datalog which is still being appended to only parses and merges the new rows.
+"""
+import io
+import json
+import logging
+from functools import partial
+from hashlib import sha1
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from ..filefuncs import replace_file
+from . import merge
+from .datalog import find_line_offset, read_datalog_since
+from .schema import read_datalog_csv, read_header
+
+
+CHECKPOINT_FILENAME = 'merge-checkpoint.json'
+FINGERPRINT_SIZE = 4096
+
+
+def get_fingerprint(path, offset):
+    """Hash the header and the bytes preceding offset to detect a datalog that was rewritten rather than appended to."""
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(max(offset - FINGERPRINT_SIZE, 0))
+        data = f.read(min(offset, FINGERPRINT_SIZE))
+    return sha1(header + data).hexdigest()
+
+
+def get_file_stats(path):
+    stat = Path(path).stat()
+    return {'name': Path(path).name, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def read_previous_row(path, offset, columns):
+    """Parse the datalog row ending at byte offset."""
+    with open(path, 'rb') as f:
+        start = max(offset - FINGERPRINT_SIZE, 0)
+        f.seek(start)
+        data = f.read(offset - start)
+    line = data.rstrip(b'\r\n').rsplit(b'\n', 1)[-1]
+    return read_datalog_csv(io.BytesIO(line), header=None, names=columns).iloc[0]
+
+
+def make_checkpoint(path, columns, offset, tag_counts, last_time):
+    """
+    The checkpoint is placed at the start of the last run of tags in the datalog since that test may
+    still be running. Its rows are merged again (along with any new rows) on the next merge.
+    """
+    return {
+        'datalog': Path(path).name,
+        'columns': list(columns),
+        'offset': int(offset),
+        'fingerprint': get_fingerprint(path, offset),
+        'last_time': None if last_time is None else str(last_time),
+        'tag_counts': {str(tag): int(count) for tag, count in tag_counts.items()},
+    }
+
+
+def ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, 2)
+        return f.read(1) == b'\n'
+
+
+def new_checkpoint(path, runs):
+    """Create a checkpoint for a datalog that has been merged in full given its tag runs."""
+    columns = read_header(path)
+    i = len(runs.starts) - 1
+    if i > 0 and runs.starts[i] == runs.n_rows - 1 and not ends_with_newline(path):
+        # the last line is still being written so its (likely truncated) tag doesn't start a new run
+        i -= 1
+    row = runs.starts[i]
+    # line 0 is the header
+    offset = find_line_offset(path, row + 1)
+    last_time = None
+    if row > 0:
+        last_time = read_previous_row(path, offset, columns)['Timestamp'].floor(merge.RESAMPLE_FREQ)
+    tag_counts = runs.counts.copy()
+    run_lengths = np.diff(np.append(runs.starts[i:], runs.n_rows))
+    for tag, run_length in zip(runs.tags.iloc[i:], run_lengths):
+        if pd.notna(tag):
+            tag_counts[tag] -= run_length
+    return make_checkpoint(path, columns, offset, tag_counts[tag_counts > 0], last_time)
+
+
+def get_test_seq_hash(test_seq_df):
+    """Hash the test sequence so a checkpoint is discarded when the test sequence is edited."""
+    return sha1(test_seq_df.to_csv(index=False).encode(encoding='UTF-8')).hexdigest()
+
+
+def read_checkpoint(data_folder):
+    """Return the saved checkpoint or None if there isn't one or it can't be read (e.g. it was cut short)."""
+    checkpoint_path = Path(data_folder).joinpath(CHECKPOINT_FILENAME)
+    if not checkpoint_path.exists():
+        return None
+    try:
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        logging.exception(f'Could not read {checkpoint_path}, merging the whole datalog')
+        return None
+    return checkpoint if isinstance(checkpoint, dict) else None
+
+
+def load_checkpoint(data_folder, paths, test_seq_df):
+    """
+    Return the checkpoint for the current datalog, test sequence and merged data
+    or None if it's missing or out of date.
+    """
+    if paths.get('test_data') is None or paths.get('old_merged') is None:
+        return None
+    checkpoint = read_checkpoint(data_folder)
+    if checkpoint is None:
+        return None
+
+    datalog = Path(paths['test_data'])
+    if (checkpoint.get('datalog') != datalog.name
+            or checkpoint.get('sessions', [datalog.name]) != [Path(path).name for path in paths['datalogs']]
+            or checkpoint.get('merged') != get_file_stats(paths['old_merged'])
+            or checkpoint.get('test_seq') != get_test_seq_hash(test_seq_df)
+            or datalog.stat().st_size <= checkpoint['offset']
+            or get_fingerprint(datalog, checkpoint['offset']) != checkpoint['fingerprint']):
+        return None
+    return checkpoint
+
+
+def load_merged_blocks(data_folder, paths):
+    """
+    Return the byte range of each tag's rows in merged.csv as recorded with the last checkpoint
+    or None if there is no record or merged.csv has changed since.
+    """
+    if (paths.get('old_merged') is None or paths.get('old_merged_tests') is None
+            or Path(paths['old_merged']) != Path(data_folder).joinpath('merged.csv')):
+        return None
+    checkpoint = read_checkpoint(data_folder)
+    if checkpoint is None or checkpoint.get('merged') != get_file_stats(paths['old_merged']):
+        return None
+    return checkpoint.get('merged_blocks')
+
+
+def save_checkpoint(checkpoint, data_folder, merged_path, datalog_paths, merged_blocks, test_seq_df):
+    """
+    Save the checkpoint along with the stats of the merged data file, the byte range of each tag's rows
+    in it (see report_data.write_merged) and the datalog sessions and test sequence it belongs to.
+    """
+    checkpoint['merged'] = get_file_stats(merged_path)
+    checkpoint['merged_blocks'] = merged_blocks
+    checkpoint['sessions'] = [Path(path).name for path in datalog_paths]
+    checkpoint['test_seq'] = get_test_seq_hash(test_seq_df)
+    # swapped in when written so an interrupted save doesn't leave a truncated checkpoint
+    replace_file(Path(data_folder).joinpath(CHECKPOINT_FILENAME), partial(json.dump, checkpoint), mode='w')
+
+
+def merge_appended_data(test_seq_df, path, checkpoint):
+    """
+    Merge the datalog rows from the checkpoint onward.
+    Returns the merged rows, the updated checkpoint and the row count of each tag in the whole datalog.
+    """
+    data_df, row_offsets = read_datalog_since(path, checkpoint['offset'], checkpoint['columns'])
+    data_df['Tag'] = merge.normalize_tags(data_df['Tag'])
+    runs = merge.scan_tag_runs([data_df['Tag']])
+    prev_counts = pd.Series(checkpoint['tag_counts'], dtype=int)
+    tag_counts = prev_counts.add(runs.counts, fill_value=0).astype(int)
+
+    ddf = merge.resample_data(merge.remove_rows_rewind(data_df))
+    if checkpoint['last_time'] is not None:
+        # the first second of the open test may have been taken by the previous test's last row
+        ddf = ddf[ddf['time'] != pd.Timestamp(checkpoint['last_time'])]
+    merged_df = merge.merge_reduced_data(test_seq_df, merge.clean_data(ddf), tag_counts)
+
+    row = runs.starts[-1]
+    if row > 0:
+        last_time = data_df['Timestamp'].iloc[row - 1].floor(merge.RESAMPLE_FREQ)
+        counts = prev_counts.add(data_df['Tag'].iloc[:row].value_counts(), fill_value=0)
+        checkpoint = make_checkpoint(path, checkpoint['columns'], row_offsets[row], counts, last_time)
+    return merged_df, checkpoint, tag_counts
+
+
+def refresh_waketimes(tests_df, test_seq_df, tag_counts, source):
+    """Update wake times of merged tests from source, which may have been merged before their waketime test ran."""
+    waketimes = merge.calc_waketimes(test_seq_df, tag_counts)
+    current = tests_df['source'] == source
+    tests_df.loc[current, 'waketime'] = tests_df.loc[current, 'test_name'].map(waketimes)
+    return tests_df
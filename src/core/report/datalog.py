@@ -0,0 +1,220 @@
+"""Read datalog csv files, caching parsed datalogs as columnar binary (npz) files."""
+import io
+import logging
+from functools import partial
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from ..filefuncs import get_cache_key, get_cache_path, replace_file
+from . import schema
+from .schema import read_datalog_csv, DATALOG_COLS
+
+
+CACHE_VERSION = 2
+CACHE_SUFFIX = '.npz'
+
+
+def parse_datalog(path, engine='pyarrow'):
+    """
+    Parse the columns of a datalog csv file used in merging.
+    The pyarrow engine reads the file on multiple threads. The pandas parser is used if pyarrow
+    isn't installed or can't parse the file.
+    """
+    if engine == 'pyarrow' and schema.pa is not None:
+        try:
+            return schema.read_datalog_arrow(path)
+        except (schema.pa.ArrowException, KeyError) as e:
+            logging.warning(f'pyarrow could not parse {path}, falling back to pandas: {e}')
+    return read_datalog_csv(path)
+
+
+def iter_datalog(path, chunksize, usecols=DATALOG_COLS):
+    """Parse a datalog csv file in chunks of chunksize rows. Chunk indexes continue from one chunk to the next."""
+    return read_datalog_csv(path, usecols=usecols, chunksize=chunksize)
+
+
+def insert_session_breaks(df, sessions, prev=None):
+    """
+    Insert an untagged row wherever consecutive rows come from different sessions so that a test which
+    was resumed in a later session is treated as rewound rather than continued. The inserted row takes
+    the timestamp of the row before it so it never starts a one second bin. prev is the timestamp and
+    session of the last row of the previous chunk of the same stream.
+    """
+    prev_sessions = np.concatenate([[-1 if prev is None else prev[1]], sessions[:-1]])
+    breaks = np.flatnonzero((sessions != prev_sessions) & (prev_sessions >= 0))
+    if not len(breaks):
+        return df
+    df = df.iloc[np.insert(np.arange(len(df)), breaks, np.maximum(breaks - 1, 0))].copy()
+    inserted = breaks + np.arange(len(breaks))
+    df.iloc[inserted, df.columns.get_loc('Tag')] = np.nan
+    if breaks[0] == 0:
+        df.iloc[0, df.columns.get_loc('Timestamp')] = prev[0]
+    return df
+
+
+def get_order_keys(timestamps, start):
+    """
+    Return keys to order a session's rows by which keep them in file order: the running maximum of their
+    timestamps starting from start (rows without a timestamp take the key of the row before).
+    """
+    keys = timestamps.values.astype('datetime64[ns]').view(np.int64)
+    return np.maximum.accumulate(np.concatenate([[start], keys]))[1:]
+
+
+def merge_sessions(session_chunks, names):
+    """
+    k-way merge of the datalogs of several test sessions, each given as an iterator of chunks, into one
+    stream of chunks ordered by timestamp. Each session's rows stay in file order. A source column holds
+    the name of the session each row came from. Chunk indexes continue from one chunk to the next.
+    """
+    # empty chunks (a datalog with only a header) are skipped
+    readers = [(chunk for chunk in chunks if not chunk.empty) for chunks in session_chunks]
+    buffers, keys = [None] * len(readers), [None] * len(readers)
+
+    def load(i, start):
+        buffers[i] = next(readers[i], None)
+        if buffers[i] is not None:
+            keys[i] = get_order_keys(buffers[i]['Timestamp'], start)
+
+    for i in range(len(readers)):
+        load(i, np.iinfo(np.int64).min)
+    prev = None
+    n_rows = 0
+    while any(buffer is not None for buffer in buffers):
+        active = [i for i, buffer in enumerate(buffers) if buffer is not None]
+        # no session can have unread rows which come before the earliest end of the buffered rows
+        watermark = min(keys[i][-1] for i in active)
+        parts, part_keys, sessions = [], [], []
+        for i in active:
+            n = np.searchsorted(keys[i], watermark, side='right')
+            parts.append(buffers[i].iloc[:n])
+            part_keys.append(keys[i][:n])
+            sessions.append(np.full(n, i))
+            if n < len(buffers[i]):
+                buffers[i], keys[i] = buffers[i].iloc[n:], keys[i][n:]
+            else:
+                load(i, keys[i][-1])
+
+        order = np.argsort(np.concatenate(part_keys), kind='stable')
+        sessions = np.concatenate(sessions)[order]
+        chunk = pd.concat(parts, ignore_index=True).iloc[order]
+        chunk = chunk.assign(source=pd.Categorical.from_codes(sessions, categories=names))
+        chunk = insert_session_breaks(chunk, sessions, prev)
+        prev = (chunk['Timestamp'].iloc[-1], sessions[-1])
+        chunk.index = pd.RangeIndex(n_rows, n_rows + len(chunk))
+        n_rows += len(chunk)
+        yield chunk
+
+
+def iter_sessions(paths, chunksize, usecols=DATALOG_COLS):
+    """Parse the datalogs of one or more sessions in chunks as a single datalog ordered by timestamp."""
+    usecols = ['Timestamp'] + [col for col in usecols if col != 'Timestamp']
+    return merge_sessions([iter_datalog(path, chunksize, usecols) for path in paths], [Path(path).name for path in paths])
+
+
+def read_sessions(paths, cache=True):
+    """Return the datalogs of one or more sessions as a single datalog ordered by timestamp."""
+    chunks = list(merge_sessions([[read_datalog(path, cache)] for path in paths], [Path(path).name for path in paths]))
+    return pd.concat(chunks) if chunks else pd.DataFrame(columns=DATALOG_COLS + ['source'])
+
+
+def find_line_offset(path, line, blocksize=2**24):
+    """Return the byte offset at which a line of a file starts (line 0 is the header of a datalog)."""
+    offset, count = 0, 0
+    with open(path, 'rb') as f:
+        while count < line:
+            block = f.read(blocksize)
+            if not block:
+                raise ValueError(f'{path} has fewer than {line + 1} lines')
+            line_ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+            if count + len(line_ends) >= line:
+                return offset + int(line_ends[line - count - 1]) + 1
+            count += len(line_ends)
+            offset += len(block)
+    return offset
+
+
+def read_datalog_since(path, offset, columns):
+    """
+    Parse the complete lines of a datalog from byte offset onward (a line still being written is ignored).
+    Returns the parsed rows and the byte offset at which each of them starts.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    data = data[:data.rfind(b'\n') + 1]
+    if not data:
+        return pd.DataFrame(columns=columns), np.array([], dtype=np.int64)
+    line_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n')) + 1
+    row_offsets = offset + np.concatenate([[0], line_ends[:-1]])
+    df = read_datalog_csv(io.BytesIO(data), header=None, names=columns)
+    return df, row_offsets
+
+
+def save_cache(df, path):
+    """Write df to the datalog's cache file as one array per column.
+
+    Text and categorical columns are stored as integer codes plus an array of unique values so the file
+    can be loaded without pickling. Returns False if df contains a column that can't be stored this way.
+    """
+    arrays = {'__key__': np.array(get_cache_key(path, CACHE_VERSION)), '__columns__': np.array(df.columns, dtype=str)}
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if pd.api.types.is_categorical_dtype(series):
+            if not all(isinstance(val, str) for val in series.cat.categories):
+                return False
+            arrays[f'codes{i}'] = series.cat.codes.values.astype(np.int32)
+            arrays[f'categories{i}'] = np.array(series.cat.categories, dtype=str)
+        elif series.dtype == object:
+            codes, uniques = pd.factorize(series)
+            if not all(isinstance(val, str) for val in uniques):
+                return False
+            arrays[f'codes{i}'] = codes.astype(np.int32)
+            arrays[f'uniques{i}'] = np.array(uniques, dtype=str)
+        else:
+            arrays[f'values{i}'] = series.values
+
+    replace_file(get_cache_path(path, CACHE_SUFFIX), partial(np.savez, **arrays))
+    return True
+
+
+def load_cache(path):
+    """Return the cached DataFrame for a datalog or None if there is no up-to-date cache."""
+    cache_path = get_cache_path(path, CACHE_SUFFIX)
+    if not cache_path.exists():
+        return None
+    with np.load(cache_path, allow_pickle=False) as npz:
+        if list(npz['__key__']) != get_cache_key(path, CACHE_VERSION):
+            return None
+        data = {}
+        for i, col in enumerate(npz['__columns__']):
+            if f'categories{i}' in npz.files:
+                data[col] = pd.Categorical.from_codes(npz[f'codes{i}'], npz[f'categories{i}'].astype(object))
+            elif f'uniques{i}' in npz.files:
+                categories = npz[f'uniques{i}'].astype(object)
+                data[col] = pd.Categorical.from_codes(npz[f'codes{i}'], categories).astype(object)
+            else:
+                data[col] = npz[f'values{i}']
+    return pd.DataFrame(data)
+
+
+def read_datalog(path, cache=True):
+    """
+    Return the datalog as a DataFrame, loading it from the cache when the datalog hasn't changed
+    since it was last parsed and refreshing the cache otherwise.
+    """
+    if cache:
+        try:
+            df = load_cache(path)
+            if df is not None:
+                return df
+        except Exception:
+            logging.exception(f'Could not load datalog cache for {path}')
+
+    df = parse_datalog(path)
+    if cache:
+        try:
+            save_cache(df, path)
+        except Exception:
+            logging.exception(f'Could not save datalog cache for {path}')
+    return df
@@ -0,0 +1,27 @@
+"""ENERGYSTAR / PCL on mode power limit functions. Area and luminance may be numbers or numpy arrays."""
+import numpy as np
+
+
+def power_cap(area, sf, a, b):
+    return sf * ((a * area) + b)
+
+
+def power_limit(area, luminance, sf, a, b, c, d, power_cap_func=None):
+    limit = sf * ((a * area + b) * luminance + c * area + d)
+    if power_cap_func is not None:
+        return np.minimum(limit, power_cap_func(area))
+    else:
+        return limit
+
+
+def get_cap_luminance(limit_func, area):
+    """
+    Return the luminance at which a limit function (power_limit with its coefficients bound by partial)
+    reaches its power cap, or None if it has no power cap.
+    """
+    coeffs = dict(limit_func.keywords)
+    power_cap_func = coeffs.pop('power_cap_func', None)
+    if power_cap_func is None:
+        return None
+    sf, a, b, c, d = (coeffs[coeff] for coeff in ['sf', 'a', 'b', 'c', 'd'])
+    return np.maximum((power_cap_func(area) / sf - c * area - d) / (a * area + b), 0)
@@ -1,29 +1,24 @@
-import datetime
-import sys
-from pathlib import Path
+from collections import namedtuple
 import numpy as np
 import pandas as pd
+from .datalog import iter_sessions
+from .apl import get_apl_store
 
 
-APL_FILES = {
-    'sdr': r'config\apl\sdr-APL.csv',
-    'clasp_hdr': r'config\apl\clasp_hdr10-APL.csv',
-}
+CHUNKSIZE = 100000
 
-def round_time(dt=None, date_delta=datetime.timedelta(seconds=1)):
-    """Round a datetime object to a multiple of a timedelta
-    dt : datetime.datetime object, default now.
-    date_delta : timedelta object, we round to a multiple of this, default 1 minute.
-    Author: Thierry Husson 2012 - Use it as you want but don't blame me.
-            Stijn Nevens 2014 - Changed to use only datetime objects as variables
-    """
-    roundTo = date_delta.total_seconds()
+# datalog rows are binned onto a grid of this frequency (one row per second) and the power and luminance
+# readings in each bin are aggregated with RESAMPLE_HOW ('mean', 'first' or 'last')
+RESAMPLE_FREQ = '1S'
+RESAMPLE_HOW = 'mean'
+MEASUREMENT_COLS = ['Power', 'Luminance']
+
+# numeric per-second columns of merged data, the other columns only depend on the tag (see split_merged)
+FACT_COLS = ['time', 'watts', 'nits', 'tag', 'seconds', "APL'", 'R', 'G', 'B']
 
-    if dt == None: dt = datetime.datetime.now()
-    seconds = (dt.to_pydatetime() - dt.min).seconds
-    # // is a floor division, not a comment on following line:
-    rounding = (seconds + roundTo / 2) // roundTo * roundTo
-    return dt + datetime.timedelta(0, rounding - seconds, -dt.microsecond)
+# runs of consecutive identical tags in a datalog: row position and tag of each run,
+# number of rows with each tag and total number of rows
+TagRuns = namedtuple('TagRuns', ['starts', 'tags', 'counts', 'n_rows'])
 
 
 def clean_tag(tag):
@@ -37,105 +32,216 @@ def clean_tag(tag):
         return float(tag)
 
 
+def parse_tags(tags, parser):
+    """
+    Apply parser to each distinct tag once and map the results back onto the rows with the tags' category codes.
+    A datalog has only tens of distinct tags so this is much faster than parsing every row.
+    """
+    tags = tags.astype('category')
+    # code -1 (untagged rows) picks the last entry so untagged rows stay NaN without the parser seeing them
+    parsed = np.array([parser(tag) for tag in tags.cat.categories] + [np.nan], dtype=object)
+    return pd.Series(parsed[tags.cat.codes.values], index=tags.index, name=tags.name).infer_objects()
+
+
 def add_stab_tests(test_seq_df, df):
     """Add a row to test_seq_df for each stabilization test in data_df"""
     stab_row = test_seq_df[test_seq_df['test_name'] == 'stabilization'].iloc[0]
-    stab_tags = df[(df['Tag'] > stab_row['tag']) & (df['Tag'] < stab_row['tag']+1)]['Tag'].unique()
-    df_list = []
-    for i, tag in enumerate(stab_tags):
-        new_row = stab_row.copy().to_frame().T
-        new_row['test_time'] = len(df[df['Tag'] == tag])
-        new_row['tag'] = tag
-        new_row['test_name'] = f'stabilization{i+1}'
-        df_list.append(new_row)
-    if df_list:
-        stab_df = pd.concat(df_list)
-        return pd.concat([test_seq_df, stab_df])
-    else:
+    tag_counts = df.groupby('Tag', sort=False).size()
+    tag_counts = tag_counts[(tag_counts.index > stab_row['tag']) & (tag_counts.index < stab_row['tag']+1)]
+    if tag_counts.empty:
         return test_seq_df
+    stab_df = stab_row.to_frame().T
+    stab_df = pd.DataFrame(np.repeat(stab_df.values, len(tag_counts), axis=0), columns=stab_df.columns,
+                           index=stab_df.index.repeat(len(tag_counts)))
+    stab_df['test_time'] = tag_counts.values
+    stab_df['tag'] = tag_counts.index.values
+    # number iterations by tag (2.1, 2.2, ...) so partial (incremental) merges name them consistently
+    iterations = np.round((tag_counts.index.values - stab_row['tag']) * 10).astype(int)
+    stab_df['test_name'] = [f'stabilization{i}' for i in iterations]
+    return pd.concat([test_seq_df, stab_df])
 
 
 def cut_off_intros(df):
     """Discards test set up and video countdown data at beginning of tests"""
-    sdf = df.groupby(['tag']).first().loc[df['tag'].unique()].reset_index()
-    sdf = sdf.dropna(subset=['test_time'])
-    df_list = []
-    for _, row in sdf.iterrows():
-        # Isolate the test data for just this test
-        tag = row['tag']
-        single_test_df = df[df['tag'] == tag].copy()
-        t = int(row['test_time'])
-        end_time = max(single_test_df['time'])
-        start_time = end_time - pd.Timedelta(seconds=t)
-        single_test_df = single_test_df[single_test_df['time'] > start_time]
-        single_test_df['seconds'] = range(len(single_test_df))
-        df_list.append(single_test_df)
-
-    return pd.concat(df_list)
+    # order tests by first appearance, keeping the order of rows within each test
+    order = np.argsort(pd.factorize(df['tag'])[0], kind='stable')
+    df = df.iloc[order]
+    test_time = df.groupby('tag')['test_time'].transform('first')
+    df = df[test_time.notna()]
+    test_time = test_time[test_time.notna()]
+    end_time = df.groupby('tag')['time'].transform('max')
+    start_time = end_time - pd.to_timedelta(test_time.astype(int), unit='s')
+    df = df[df['time'] > start_time].copy()
+    df['seconds'] = df.groupby('tag').cumcount()
+    return df
 
 
 def add_apl_data(df):
-    """Merge APL data to main df."""
-    apl_dfs = {clip_name: pd.read_csv(Path(sys.path[0]).joinpath(file)) for clip_name, file in APL_FILES.items()}
-    df_list = []
-    for clip_name, apl_df in apl_dfs.items():
-        apl_df['video'] = clip_name
-        df_list.append(apl_df)
-
-    all_apl_df = pd.concat(df_list)
-    df = df.merge(all_apl_df, on=['video', 'seconds'], how='left')
+    """Add APL data to main df."""
+    apl_df = get_apl_store().lookup(df['video'], df['seconds'])
+    df = pd.concat([df.reset_index(drop=True), apl_df], axis=1)
     df["APL'"] = df["APL'"].fillna(0)
     return df
 
 
 def remove_rows_rewind(df, col='Tag'):
-
-    start_tag_seq_df = df[df[col]!=df[col].shift(1)].dropna(subset=[col])
-    duplicate_start = start_tag_seq_df[start_tag_seq_df[col].duplicated(keep='last')].index.values
-
-    end_tag_seq_df = df[df[col]!=df[col].shift(-1)].dropna(subset=[col])
-    duplicate_end = end_tag_seq_df[end_tag_seq_df[col].duplicated(keep='last')].index.values + 1
-
-    remove_rows = []
-    for start, end in zip(duplicate_start, duplicate_end):
-        remove_rows += range(start, end)
-    return df.drop(remove_rows)
-
-
-def add_waketimes(merged_df, test_seq_df, data_df):
-    """Calculate wake times from the test data and return as a dictionary."""
-    waketimes = {}
-    for _, row in test_seq_df.iterrows():
-        if 'waketime' in row['test_name']:
-            standby_tag = row['tag'] - 1
-            standby_test = test_seq_df.query('tag==@standby_tag')['test_name'].iloc[0]
-            wt_tag = f"{row['tag'] + .1} - user command"
-            waketime = len(data_df.query('Tag==@wt_tag'))
-            waketimes[standby_test] = waketime
-            
+    """Discard the earlier runs of a tag that was repeated later on (the test was rewound)."""
+    tags = df[col]
+    # NaN != NaN so every untagged row starts its own run and untagged rows are never removed
+    starts = np.flatnonzero((tags != tags.shift(1)).values)
+    run_tags = tags.iloc[starts]
+    rewound = (run_tags.duplicated(keep='last') & run_tags.notna()).values
+    run_lengths = np.diff(np.append(starts, len(df)))
+    return df[~np.repeat(rewound, run_lengths)]
+
+
+def calc_waketimes(test_seq_df, tag_counts):
+    """Calculate wake times from the datalog tag counts and return as a dictionary keyed by standby test name."""
+    wt_df = test_seq_df[test_seq_df['test_name'].str.contains('waketime')]
+    test_names = test_seq_df.drop_duplicates(subset=['tag']).set_index('tag')['test_name']
+    standby_tests = test_names.reindex(wt_df['tag'] - 1).values
+    wt_tags = [f"{tag + .1} - user command" for tag in wt_df['tag']]
+    counts = pd.Series(tag_counts, dtype=int).reindex(wt_tags, fill_value=0).values
+    return {standby_test: count for standby_test, count in zip(standby_tests, counts) if pd.notna(standby_test)}
+
+
+def add_waketimes(merged_df, test_seq_df, tag_counts):
+    """Add wake times calculated from the datalog tag counts to merged_df."""
+    waketimes = calc_waketimes(test_seq_df, tag_counts)
     merged_df['waketime'] = merged_df['test_name'].apply(waketimes.get)
     return merged_df
 
 
+def normalize_tags(tags):
+    """Strip the description from camera ccf tags"""
+    return parse_tags(tags, lambda tag: tag[0] if 'camera ccf' in str(tag) else tag)
+
+
+def resample_data(ddf, freq=None, how=None):
+    """
+    Bin rows onto a grid of freq (timestamps are floored to the grid) and keep one row per bin.
+    Each bin takes the tag of its first row. Power and luminance are aggregated using how ('mean', 'first' or 'last')
+    over the bin's rows which belong to that same run of tags.
+    freq and how default to RESAMPLE_FREQ and RESAMPLE_HOW as they are when called.
+    """
+    freq = RESAMPLE_FREQ if freq is None else freq
+    how = RESAMPLE_HOW if how is None else how
+    ddf = ddf.assign(time=ddf['Timestamp'].dt.floor(freq))
+    if how != 'first':
+        run = (ddf['Tag'] != ddf['Tag'].shift(1)).cumsum().rename('run')
+        agg = {col: how if col in MEASUREMENT_COLS else 'first' for col in ddf.columns if col != 'time'}
+        ddf = ddf.groupby(['time', run], sort=False).agg(agg).reset_index().drop('run', axis=1)
+    return ddf.drop_duplicates(subset=['time'])
+
+
+def clean_data(ddf):
+    """Select the columns used in merging and convert tags to numbers, discarding untagged rows."""
+    ddf = ddf.reset_index()[['time', 'Power', 'Luminance', 'Tag'] + (['source'] if 'source' in ddf.columns else [])]
+    ddf = ddf.dropna(subset=['Tag'])
+    ddf['Tag'] = parse_tags(ddf['Tag'], clean_tag)
+    return ddf.dropna(subset=['Tag'])
+
+
+def merge_reduced_data(test_seq_df, reduced_df, tag_counts):
+    """Merge test sequence data and APL data onto datalog data already reduced to one row per second."""
+    test_seq_df = add_stab_tests(test_seq_df, reduced_df)
+    reduced_df = reduced_df.rename(columns={'Power': 'watts', 'Luminance': 'nits', 'Tag': 'tag'})
+    merged_df = reduced_df.merge(test_seq_df, on='tag', how='left')
+    merged_df = cut_off_intros(merged_df)
+    merged_df = add_apl_data(merged_df)
+    merged_df = add_waketimes(merged_df, test_seq_df, tag_counts)
+    return merged_df
+
+
 def merge_test_data(test_seq_df, data_df):
     """
     Merges test output data, test sequence data, and APL data
     into a single cleaned csv ready to be used in data report script.
     """
     ddf = data_df.copy()
-    ddf['Tag'] = ddf['Tag'].apply(lambda tag: tag[0] if 'camera ccf' in tag else tag)
-    merged_df = remove_rows_rewind(ddf)
-    merged_df['time'] = merged_df['Timestamp'].apply(round_time)
-    merged_df = merged_df.drop_duplicates(subset=['time'])
-    merged_df = merged_df.reset_index()[['time', 'Power', 'Luminance', 'Tag']]
-    merged_df = merged_df.dropna(subset=['Tag'])
-    merged_df['Tag'] = merged_df['Tag'].apply(clean_tag)
-    merged_df = merged_df.dropna(subset=['Tag'])
-    test_seq_df = add_stab_tests(test_seq_df, merged_df)
-    merged_df.columns = ['time', 'watts', 'nits', 'tag']
-    merged_df = merged_df.merge(test_seq_df, on='tag', how='left')
-    merged_df = cut_off_intros(merged_df)
-    merged_df = add_apl_data(merged_df)
-    merged_df = add_waketimes(merged_df, test_seq_df, data_df)
-    return merged_df
+    ddf['Tag'] = normalize_tags(ddf['Tag'])
+    reduced_df = clean_data(resample_data(remove_rows_rewind(ddf)))
+    return merge_reduced_data(test_seq_df, reduced_df, ddf['Tag'].value_counts())
+
+
+def split_merged(merged_df):
+    """
+    Split merged data into a fact table of numeric time series columns and a table with one row per tag
+    holding the test columns (test name, video, picture settings, wake time...).
+    """
+    facts_df = merged_df[[col for col in FACT_COLS if col in merged_df.columns]]
+    tests_df = merged_df[['tag'] + [col for col in merged_df.columns if col not in FACT_COLS]]
+    return facts_df, tests_df.drop_duplicates(subset=['tag'], keep='last').reset_index(drop=True)
+
+
+def replace_tests(old_df, new_df):
+    """Replace the rows of old_df belonging to the tags in new_df with the rows of new_df."""
+    return pd.concat([old_df[~old_df['tag'].isin(new_df['tag'])], new_df], ignore_index=True)
+
+
+def join_tests(facts_df, tests_df):
+    """Join the test columns back onto each row of the fact table."""
+    return facts_df.merge(tests_df, on='tag', how='left')
 
+
+def scan_tag_runs(tag_chunks):
+    """
+    Find the runs of consecutive identical tags in a datalog's normalized Tag column given in chunks.
+    Chunk indexes must be row positions within the datalog.
+    """
+    starts, tags = [], []
+    counts = pd.Series(dtype=int)
+    n_rows = 0
+    prev_tag = None
+    for chunk_tags in tag_chunks:
+        if chunk_tags.empty:
+            continue
+        counts = counts.add(chunk_tags.value_counts(), fill_value=0)
+        # NaN != NaN so every untagged row starts its own run, same as remove_rows_rewind
+        new_run = chunk_tags != chunk_tags.shift(1)
+        new_run.iloc[0] = chunk_tags.iloc[0] != prev_tag
+        starts.append(chunk_tags.index.values[new_run.values])
+        tags.append(chunk_tags[new_run].values)
+        prev_tag = chunk_tags.iloc[-1]
+        n_rows = chunk_tags.index[-1] + 1
+
+    starts = np.concatenate(starts) if starts else np.array([], dtype=int)
+    tags = pd.Series(np.concatenate(tags) if tags else [], dtype=object)
+    return TagRuns(starts, tags, counts.astype(int), n_rows)
+
+
+def get_tag_runs(paths, chunksize=CHUNKSIZE):
+    """
+    Scan the Tag column of the datalogs at paths (one per session, merged by timestamp)
+    in chunks of chunksize rows for runs of identical tags.
+    """
+    return scan_tag_runs(normalize_tags(chunk['Tag']) for chunk in iter_sessions(paths, chunksize, usecols=['Tag']))
+
+
+def merge_test_data_chunked(test_seq_df, paths, chunksize=CHUNKSIZE, runs=None):
+    """
+    Streaming version of merge_test_data which reads the datalogs at paths (one per session, merged by
+    timestamp) in chunks of chunksize rows. The datalogs are read twice: once to find rewound tests and once
+    to reduce each chunk to one row per second. Only the reduced data is held in memory.
+    The first pass is skipped if the datalogs' tag runs are given.
+    """
+    if runs is None:
+        runs = get_tag_runs(paths, chunksize)
+    rewound = (runs.tags.duplicated(keep='last') & runs.tags.notna()).values
+    reduced_dfs = []
+    carry = None
+    for chunk in iter_sessions(paths, chunksize):
+        chunk['Tag'] = normalize_tags(chunk['Tag'])
+        run_idx = np.searchsorted(runs.starts, chunk.index.values, side='right') - 1
+        chunk = pd.concat([carry, chunk[~rewound[run_idx]]])
+        if chunk.empty:
+            continue
+        # hold back the last bin in case it continues into the next chunk
+        last_bin = chunk['Timestamp'].dt.floor(RESAMPLE_FREQ) == chunk['Timestamp'].iloc[-1].floor(RESAMPLE_FREQ)
+        carry = chunk[last_bin]
+        reduced_dfs.append(resample_data(chunk[~last_bin]))
+    if carry is not None:
+        reduced_dfs.append(resample_data(carry))
+
+    reduced_df = clean_data(pd.concat(reduced_dfs).drop_duplicates(subset=['time']))
+    return merge_reduced_data(test_seq_df, reduced_df, runs.counts)
@@ -9,6 +9,7 @@ from colour.models import BT2020_COLOURSPACE, BT709_COLOURSPACE
 from colour.colorimetry.spectrum import SpectralDistribution
 from colour.plotting import plot_sds_in_chromaticity_diagram_CIE1931
 from colour.plotting import plot_RGB_colourspaces_in_chromaticity_diagram_CIE1931
+from .limits import get_cap_luminance
 
 rcParams['font.family'] = "sans-serif"
 rcParams['font.sans-serif'] = "Calibri"
@@ -346,18 +347,12 @@ def dimming_line_scatter(pps, rsdf, area, limit_funcs):
 
     min_lum, max_lum = 0, max(lums)*1.25
     
-    if 'power_cap_func' in limit_func.keywords:
-        lum_bend = 0
-        prev_lim, new_lim = limit_func(area, luminance=lum_bend-1), limit_func(area, luminance=lum_bend)
-        while new_lim > prev_lim:
-            prev_lim = new_lim
-            lum_bend += 1
-            new_lim = limit_func(area, luminance=lum_bend)
-        
-        max_lum = max(max_lum, lum_bend*1.25)
+    cap_lum = get_cap_luminance(limit_func, area)
+    if cap_lum is not None:
+        max_lum = max(max_lum, cap_lum*1.25)
     
     xs = np.arange(min_lum, max_lum, .1)
-    ys = [limit_func(area=area, luminance=i) for i in xs]
+    ys = limit_func(area=area, luminance=xs)
     plt.plot(xs, ys, color='tab:orange')
     
     handle = mlines.Line2D([], [], linewidth=1, label=f'Power Limit', color='tab:orange')
@@ -1,23 +1,33 @@
-import sys
-import random
+import os
+import inspect
 import shutil
 from collections import defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from functools import partial
 import warnings
 import numpy as np
 import pandas as pd
 from colour.models import BT2020_COLOURSPACE, BT709_COLOURSPACE
-from colour import XYZ_to_Lab, Lab_to_LCHab
+from colour import RGB_COLOURSPACES
 from . import merge
+from .datalog import read_datalog, read_sessions
+from .schema import read_merged_csv, read_header
+from .spectral import SpectralProfile
+from .limits import power_cap, power_limit
+from .checkpoint import load_checkpoint, new_checkpoint, save_checkpoint, merge_appended_data, refresh_waketimes, \
+    load_merged_blocks
 from ..error_handling import permission_popup, except_none_log
+from ..entry_forms import read_sheet
+from ..config import get_config, memoize
 from ..filefuncs import archive
 
 @except_none_log
 def get_test_specs_df(merged_df, paths, report_type):
     """Create a dataframe from test-metadata.csv and test data which displays the test specifics."""
     if report_type == 'pcl' and paths['entry_forms'] is not None:
-        test_specs_df = pd.read_excel(paths['entry_forms'], sheet_name='Misc', header=None, index_col=0)
+        test_specs_df = read_sheet(paths['entry_forms'], 'Misc', header=None, index_col=0)
         test_specs_df.columns = [0]
     else:
         test_specs_df = pd.read_csv(paths['test_metadata'], encoding='iso-8859-1', header=None, index_col=0)
@@ -49,26 +59,37 @@ def get_test_specs_df(merged_df, paths, report_type):
 
     return test_specs_df
 
+# test settings and measurements summarized for each test in the results summary
+RESULTS_SETTINGS = ['test_name', 'test_time', 'preset_picture', 'video', 'abc', 'lux', 'qs', 'lan', 'wan']
+RESULTS_MEASUREMENTS = ['watts', 'nits', "APL'"]
+# standby tests are summarized by their last 20 minutes
+STANDBY_TAIL = 20 * 60
+
 @except_none_log
 @permission_popup
 def get_results_summary_df(merged_df, data_folder, waketimes):
-    """Create a dataframe with one line per test showing test info and test results (average watts and nits)."""
-    rsdf = merged_df.groupby(['tag']).first()
-
-    cols = ['test_name', 'test_time', 'preset_picture', 'video', 'abc', 'lux', 'qs', 'lan', 'wan']
-    cols = [col for col in cols if col in rsdf.columns]
-    rsdf = rsdf[cols]
-    avg_cols = ['watts', 'nits', "APL'"]
-    rsdf = pd.concat([rsdf, merged_df.groupby(['tag']).mean()[avg_cols]], axis=1)
-    rsdf['waketime'] = rsdf['test_name'].apply(waketimes.get)
-
-    for i, row in rsdf.reset_index().iterrows():
-        if 'standby' in row['test_name']:
-            # todo: handle standby test not being long enough
-            if len(merged_df) > (20*60):
-                last20_df = merged_df[merged_df['tag'] == row['tag']].iloc[-20 * 60:]
-                for col in ['watts', 'nits']:
-                    rsdf.loc[row['tag'], col] = last20_df[col].mean()
+    """
+    Create a dataframe with one line per test showing test info and test results (average watts and nits)
+    followed by the min, max and standard deviation of watts and nits and the energy used in Wh.
+    """
+    settings = [col for col in RESULTS_SETTINGS if col in merged_df.columns]
+    tail = merged_df.groupby('tag').cumcount(ascending=False) < STANDBY_TAIL
+    df = merged_df.assign(tail_watts=merged_df['watts'].where(tail), tail_nits=merged_df['nits'].where(tail))
+    aggs = {col: (col, 'first') for col in settings}
+    aggs.update({col: (col, 'mean') for col in RESULTS_MEASUREMENTS})
+    aggs.update({f'tail_{col}': (f'tail_{col}', 'mean') for col in ['watts', 'nits']})
+    aggs.update({f'{col}_{how}': (col, how) for col in ['watts', 'nits'] for how in ['min', 'max', 'std']})
+    aggs['energy_wh'] = ('watts', 'sum')
+    rsdf = df.groupby('tag').agg(**aggs)
+
+    rsdf['energy_wh'] *= pd.Timedelta(merge.RESAMPLE_FREQ).total_seconds() / 3600
+    rsdf.insert(len(settings) + len(RESULTS_MEASUREMENTS), 'waketime', rsdf['test_name'].apply(waketimes.get))
+    # todo: handle standby test not being long enough
+    if len(merged_df) > STANDBY_TAIL:
+        standby = rsdf['test_name'].str.contains('standby', na=False)
+        for col in ['watts', 'nits']:
+            rsdf.loc[standby, col] = rsdf.loc[standby, f'tail_{col}']
+    rsdf = rsdf.drop(columns=['tail_watts', 'tail_nits'])
 
     rsdf.to_csv(Path(data_folder).joinpath('results-summary.csv'))
     return rsdf
@@ -181,7 +202,7 @@ def get_standby_df(rsdf):
 
 @except_none_log
 def get_persistence_dfs(paths):
-    df = pd.read_excel(paths['entry_forms'], sheet_name='Persistence Summary')
+    df = read_sheet(paths['entry_forms'], 'Persistence Summary')
     persistence_dfs = {}
     for mode in ['SDR', 'HDR 10', 'HLG', 'Dolby Vision']:
         start_idx = [i for i, col in enumerate(df.columns) if mode in col][0]
@@ -214,27 +235,21 @@ def get_report_type(docopt_args, data_folder):
     return report_type
 
 @except_none_log
+@memoize
 def power_cap_funcs():
-    def power_cap(area, sf, a, b):
-        return sf * ((a * area) + b)
-    power_cap_coeffs = pd.read_csv(Path(sys.path[0]).joinpath(r'config\power-cap-coeffs.csv'), index_col='coef').to_dict()
+    power_cap_coeffs = get_config('power_cap_coeffs').to_dict()
     power_cap_funcs = {func_name: partial(power_cap, **coeff_vals) for func_name, coeff_vals in
                        power_cap_coeffs.items()}
     return power_cap_funcs
 
 @except_none_log
+@memoize
 def get_limit_funcs(report_type):
-    def power_limit(area, luminance, sf, a, b, c, d, power_cap_func=None):
-        limit = sf * ((a * area + b) * luminance + c * area + d)
-        if power_cap_func is not None:
-            return min(limit, power_cap_func(area))
-        else:
-            return limit
-    
-    coeffs = pd.read_csv(Path(sys.path[0]).joinpath(r'config\coeffs.csv'), index_col='coef').to_dict()
+    coeffs = get_config('coeffs').to_dict()
     if report_type == 'estar':
+        cap_funcs = power_cap_funcs()
         for func_name in coeffs:
-            coeffs[func_name]['power_cap_func'] = power_cap_funcs()[func_name]
+            coeffs[func_name]['power_cap_func'] = cap_funcs[func_name]
 
     limit_funcs = {func_name: partial(power_limit, **coeff_vals) for func_name, coeff_vals in coeffs.items()}
     return limit_funcs
@@ -242,6 +257,10 @@ def get_limit_funcs(report_type):
 @except_none_log
 @permission_popup
 def get_status_df(test_seq_df, merged_df, paths, data_folder):
+    """
+    Write and return the run status of each test. Only the test_name and waketime columns of merged_df are used
+    so the per tag test table (test-info.csv) can be given instead of the merged data.
+    """
     cols = ['tag', 'test_name', 'test_time']
     status_df = test_seq_df.copy()[cols]
     status_df = status_df[status_df['test_name'] != 'screen_config']
@@ -272,36 +291,134 @@ def get_test_seq_df(paths):
     
 @except_none_log
 @permission_popup
-def get_merged_df(test_seq_df, paths, data_folder):
+def get_tests_df(data_folder):
+    """Read the per tag test table (test-info.csv) written by get_merged_df."""
+    return pd.read_csv(Path(data_folder).joinpath('test-info.csv'))
+
+@except_none_log
+@permission_popup
+def get_merged_df(test_seq_df, paths, data_folder, chunksize=None, load=True):
     
-    data_df = pd.read_csv(paths['test_data'], parse_dates=['Timestamp'])
-    merged_df = merge.merge_test_data(test_seq_df, data_df)
-    merged_df['source'] = Path(paths['test_data']).name
+    # the datalogs of all sessions are merged in timestamp order, the checkpoint follows the latest session
+    datalogs = paths['datalogs']
+    source = Path(paths['test_data']).name
+    checkpoint = load_checkpoint(data_folder, paths, test_seq_df)
+    tag_counts = None
+    if checkpoint is not None:
+        # only merge the rows appended to the datalog since it was last merged
+        merged_df, checkpoint, tag_counts = merge_appended_data(test_seq_df, paths['test_data'], checkpoint)
+        merged_df['source'] = source
+    elif chunksize:
+        runs = merge.get_tag_runs(datalogs, int(chunksize))
+        merged_df = merge.merge_test_data_chunked(test_seq_df, datalogs, int(chunksize), runs)
+        if len(datalogs) > 1:
+            runs = merge.get_tag_runs([paths['test_data']], int(chunksize))
+        checkpoint = new_checkpoint(paths['test_data'], runs)
+    else:
+        data_df = read_sessions(datalogs)
+        merged_df = merge.merge_test_data(test_seq_df, data_df)
+        if len(datalogs) > 1:
+            data_df = read_datalog(paths['test_data'])
+        checkpoint = new_checkpoint(paths['test_data'], merge.scan_tag_runs([merge.normalize_tags(data_df['Tag'])]))
+    new_facts_df, tests_df = merge.split_merged(merged_df)
+    facts_df = new_facts_df
+    merged_path = Path(data_folder).joinpath('merged.csv')
+    blocks = load_merged_blocks(data_folder, paths)
     
-    if paths['old_merged'] is not None:
-        old_merged_df = pd.read_csv(paths['old_merged'])
+    if paths['old_merged'] is None:
+        blocks = write_merged(facts_df, merged_path)
+    elif blocks is not None and read_header(merged_path) == list(facts_df.columns):
+        # replace the rows of the tests in the new data, the other tests' rows are left untouched in the file
+        old_tests_df = pd.read_csv(paths['old_merged_tests'])
+        if load:
+            facts_df = merge.replace_tests(read_merged_csv(merged_path), new_facts_df)
+        # the last test's rows are merged again on every call, only archive when other tests' rows are replaced
+        new_tags = set(new_facts_df['tag'])
+        if [block for block in blocks if block[0] in new_tags] != blocks[-1:]:
+            archive(paths['old_merged'])
+            archive(paths['old_merged_tests'])
+        blocks = write_merged(new_facts_df, merged_path, blocks)
+    else:
+        old_facts_df, old_tests_df = read_merged(paths)
         archive(paths['old_merged'])
-        old_merged_df = old_merged_df.append({'test_name':-1}, ignore_index=True)
-        merged_df = pd.concat([old_merged_df, merged_df]).reset_index()[merged_df.columns]
-        merged_df = merge.remove_rows_rewind(merged_df, col='test_name')
-        merged_df = merged_df.query('test_name!=-1')
-        
+        facts_df = merge.replace_tests(old_facts_df, facts_df)
+        blocks = write_merged(facts_df, merged_path)
+    
+    if paths['old_merged'] is not None:
+        tests_df = merge.replace_tests(old_tests_df, tests_df)
+        tests_df = tests_df[tests_df['tag'].isin([block[0] for block in blocks])].reset_index(drop=True)
+        if tag_counts is not None:
+            tests_df = refresh_waketimes(tests_df, test_seq_df, tag_counts, source)
         
-    merged_df.to_csv(Path(data_folder).joinpath('merged.csv'), index=False)
+    tests_df.to_csv(Path(data_folder).joinpath('test-info.csv'), index=False)
+    save_checkpoint(checkpoint, data_folder, merged_path, datalogs, blocks, test_seq_df)
     
     # todo: handle different report types
     
-    return merged_df
+    if load:
+        return merge.join_tests(facts_df, tests_df)
+
+def write_merged(facts_df, path, blocks=None):
+    """
+    Write merged facts to path with each tag's rows in one block and return the byte range
+    of each block as [tag, offset, size] in file order.
+    Given the blocks of the existing file, only the blocks of the tags in facts_df are replaced:
+    when those come after all the blocks being kept (the usual case: the tests still running) the file
+    is truncated and the new blocks appended, otherwise the kept blocks are copied byte for byte.
+    """
+    new_blocks = [(tag, block.to_csv(header=False, index=False).encode(encoding='UTF-8'))
+                  for tag, block in facts_df.groupby('tag', sort=False)]
+    if blocks is None:
+        header = facts_df.iloc[:0].to_csv(index=False).encode(encoding='UTF-8')
+        with open(path, 'wb') as f:
+            f.write(header)
+        kept = []
+    else:
+        new_tags = {tag for tag, _ in new_blocks}
+        kept = [block for block in blocks if block[0] not in new_tags]
+        replaced = [block for block in blocks if block[0] in new_tags]
+        kept_end = max([offset + size for _, offset, size in kept], default=0)
+        cut = min([offset for _, offset, _ in replaced], default=Path(path).stat().st_size)
+        if kept_end <= cut:
+            with open(path, 'r+b') as f:
+                f.truncate(cut)
+        else:
+            tmp_path = Path(path).with_suffix('.tmp')
+            with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                dst.write(src.read(min(offset for _, offset, _ in blocks)))
+                for i, (tag, offset, size) in enumerate(kept):
+                    src.seek(offset)
+                    kept[i] = [tag, dst.tell(), size]
+                    dst.write(src.read(size))
+            os.replace(tmp_path, path)
+
+    with open(path, 'ab') as f:
+        f.seek(0, os.SEEK_END)
+        for tag, data in new_blocks:
+            kept.append([float(tag), f.tell(), len(data)])
+            f.write(data)
+    return kept
+
+
+def read_merged(paths):
+    """
+    Read the fact table (merged.csv) and per tag test table (test-info.csv) of previously merged data.
+    merged.csv files written before the tables were split still hold the test columns and are split here.
+    """
+    old_merged_df = read_merged_csv(paths['old_merged'])
+    if 'test_name' in old_merged_df.columns:
+        return merge.split_merged(old_merged_df)
+    old_tests_df = pd.read_csv(paths['old_merged_tests'])
+    archive(paths['old_merged_tests'])
+    return old_merged_df, old_tests_df
 
 @except_none_log
-def get_spectral_df(paths):
-    df = pd.read_csv(paths['spectral_profile']).iloc[39:]
-    
-    df = df.astype(float).set_index(df.columns[0])
-    df = df[df.columns[:4]]
-    df.columns = [i.split('(')[0].strip() for i in df.columns]
-    df.index.name = 'Wavelength (nm)'
-    return df
+def get_spectral_profile(paths):
+    return SpectralProfile.from_csv(paths['spectral_profile'])
+
+@except_none_log
+def get_spectral_df(spectral_profile):
+    return spectral_profile.spectral_df
 
 @except_none_log
 @permission_popup
@@ -313,210 +430,139 @@ def get_contrast_ratio(paths):
 
 @except_none_log
 @permission_popup
-def get_spectral_summary_df(data):
+def get_spectral_summary_df(bt2020_coverage, bt709_coverage, contrast_ratio, brightness_loss_crossover,
+                            washout_crossovers, color_shift_crossovers, data_folder):
     ss_data = {
-        'BT2020 Coverage': data['bt2020_coverage'],
-        'BT709 Coverage': data['bt709_coverage'],
-        'Contrast Ratio': data['contrast_ratio'],
-        '75% Brightness Loss Angle': data['brightness_loss_crossover'],
-        '80% Color Washout Angle Red': data['washout_crossovers']['Red'],
-        '80% Color Washout Angle Green': data['washout_crossovers']['Green'],
-        '80% Color Washout Angle Blue': data['washout_crossovers']['Blue'],
-        '3 degree Color Shift Angle Red': data['color_shift_crossovers']['positive']['Red'],
-        '3 degree Color Shift Angle Green': data['color_shift_crossovers']['positive']['Green'],
-        '3 degree Color Shift Angle Blue': data['color_shift_crossovers']['positive']['Blue'],
-        '-3 degree Color Shift Angle Red': data['color_shift_crossovers']['negative']['Red'],
-        '-3 degree Color Shift Angle Green': data['color_shift_crossovers']['negative']['Green'],
-        '-3 degree Color Shift Angle Blue': data['color_shift_crossovers']['negative']['Blue'],
+        'BT2020 Coverage': bt2020_coverage,
+        'BT709 Coverage': bt709_coverage,
+        'Contrast Ratio': contrast_ratio,
+        '75% Brightness Loss Angle': brightness_loss_crossover,
+        '80% Color Washout Angle Red': washout_crossovers['Red'],
+        '80% Color Washout Angle Green': washout_crossovers['Green'],
+        '80% Color Washout Angle Blue': washout_crossovers['Blue'],
+        '3 degree Color Shift Angle Red': color_shift_crossovers['positive']['Red'],
+        '3 degree Color Shift Angle Green': color_shift_crossovers['positive']['Green'],
+        '3 degree Color Shift Angle Blue': color_shift_crossovers['positive']['Blue'],
+        '-3 degree Color Shift Angle Red': color_shift_crossovers['negative']['Red'],
+        '-3 degree Color Shift Angle Green': color_shift_crossovers['negative']['Green'],
+        '-3 degree Color Shift Angle Blue': color_shift_crossovers['negative']['Blue'],
     }
     spectral_summary_df = pd.DataFrame(ss_data, index=[0]).T
-    save_path = data['data_folder'].joinpath('spectral_summary.csv')
+    save_path = data_folder.joinpath('spectral_summary.csv')
     spectral_summary_df.to_csv(save_path, header=False)
     return spectral_summary_df
 
 @except_none_log
-def get_spectral_coordinates_df(paths):
-    df = pd.read_csv(paths['spectral_profile']).iloc[18:20]
-    df = df.set_index(df.columns[0]).astype(float)
-    df.index.name = ''
-    df = df[['Red(0)', 'Green(0)', 'Blue(0)']]
-    df.columns = ['Red', 'Green', 'Blue']
-    return df.reset_index()
-
-@except_none_log
-def get_washout_df(paths):
-    df = pd.read_csv(paths['spectral_profile'])
-    df = df.set_index(df.columns[0])
-    df.index.name = ''
-    df = df.iloc[12:15].T
-
-    df = df.reset_index()
-
-    df['color'] = df['index'].apply(lambda s: s.split('(')[0].strip())
-    df['angle'] = df['index'].apply(lambda s: s.split('(')[1].replace(')', '')).astype(int)
-
-    df['X'] = df['X'].astype(float)
-    df['Y'] = df['Y'].astype(float)
-    df['Z'] = df['Z'].astype(float)
-
-    df['normX'] = (df['X']/df['X'][0]).apply(lambda x: min(x, 1))
-    df['normY'] = (df['Y']/df['Y'][0]).apply(lambda x: min(x, 1))
-    df['normZ'] = (df['Z']/df['Z'][0]).apply(lambda x: min(x, 1))
-    lab = df[['normX', 'normY', 'normZ']].apply(XYZ_to_Lab, axis=1)
-    df['lchab'] = lab.apply(Lab_to_LCHab)
-    df['l'] = df['lchab'].apply(lambda x: x[0])
-
-    df['c'] = df['lchab'].apply(lambda x: x[1])
-    df['h'] = df['lchab'].apply(lambda x: x[2])
-    df = df[['color', 'angle', 'l', 'c', 'h']].set_index(['color', 'angle'])
-    df = df['c'].to_frame().reset_index()
-    df = df.pivot(index='angle', columns='color')
-    df.columns = [i[1] for i in df.columns]
-    for col in df.columns:
-        df[col] = (df[col]/df[col].values[0]).apply(lambda x: min(x, 1))
-    df = df.drop('White', axis=1)
-    return df
-
-@except_none_log
-def get_color_shift_df(paths):
-    df = pd.read_csv(paths['spectral_profile'])
-    df = df.set_index(df.columns[0])
-    df.index.name = ''
-
-    df = df.iloc[12:15].T
-
-    df = df.reset_index()
-
-    df['color'] = df['index'].apply(lambda s: s.split('(')[0].strip())
-    df['angle'] = df['index'].apply(lambda s: s.split('(')[1].replace(')', '')).astype(int)
-
-    df['X'] = df['X'].astype(float)
-    df['Y'] = df['Y'].astype(float)
-    df['Z'] = df['Z'].astype(float)
-
-    df['normX'] = (df['X']/df['X'][0]).apply(lambda x: min(x, 1))
-    df['normY'] = (df['Y']/df['Y'][0]).apply(lambda x: min(x, 1))
-    df['normZ'] = (df['Z']/df['Z'][0]).apply(lambda x: min(x, 1))
-    lab = df[['normX', 'normY', 'normZ']].apply(XYZ_to_Lab, axis=1)
-    df['lchab'] = lab.apply(Lab_to_LCHab)
-    df['l'] = df['lchab'].apply(lambda x: x[0])
-    df['l'] = df['l']
-    df['c'] = df['lchab'].apply(lambda x: x[1])
-    df['h'] = df['lchab'].apply(lambda x: x[2])
-    df = df[['color', 'angle', 'l', 'c', 'h']].set_index(['color', 'angle'])
-    df = df['h'].to_frame().reset_index()
-    df = df.pivot(index='angle', columns='color')
-    df.columns = [i[1] for i in df.columns]
-    for col in df.columns:
-        df[col] = (df[col]-df[col].values[0])
-    df = df.drop('White', axis=1)
-    return df
-
-@except_none_log
-def get_brightness_loss_df(paths):
-    df = pd.read_csv(paths['spectral_profile'])
-    df = df.set_index(df.columns[0])
-    df.index.name = ''
-    df = df.iloc[12:15].T
-    df = df.reset_index()
-    df['color'] = df['index'].apply(lambda s: s.split('(')[0].strip())
-    df['angle'] = df['index'].apply(lambda s: s.split('(')[1].replace(')', '')).astype(int)
-    df['Y'] = df['Y'].astype(float)
-    df['normY'] = (df['Y'] / df['Y'][0]).apply(lambda x: min(x, 1))
-    df = df[['color', 'angle', 'normY']]
-    df = df.pivot(index='angle', columns='color')
-    df.columns = [i[1] for i in df.columns]
-    return df[['White']]
-
-
-def get_crossover_x(series, crossover_y):
-    dc_mask = (series > crossover_y) & (crossover_y > series.shift(-1))
-    dc_masked_series = series[dc_mask]
-    crossover_x = None
-    if len(dc_masked_series) > 0:
-        x1 = dc_masked_series.index[0]
-
-        x2 = series.index[list(series.index).index(x1) + 1]
-        y1 = series.loc[x1]
-        y2 = series.loc[x2]
-        slope = (y2 - y1) / (x2 - x1)
-        crossover_x = x1 + (crossover_y - y1) / slope
-        return crossover_x
-    uc_mask = ((series > crossover_y) & (crossover_y > series.shift(1)))
-    uc_masked_series = series[uc_mask]
-    if len(uc_masked_series) > 0:
-        x1 = uc_masked_series.index[0]
-
-        x2 = series.index[list(series.index).index(x1) - 1]
-        y1 = series.loc[x1]
-        y2 = series.loc[x2]
-        slope = (y2 - y1) / (x2 - x1)
-        crossover_x = x1 + (crossover_y - y1) / slope
-        return crossover_x
-    return crossover_x
+def get_spectral_coordinates_df(spectral_profile):
+    return spectral_profile.coordinates_df
+
+@except_none_log
+def get_washout_df(spectral_profile):
+    return spectral_profile.washout_df
+
+@except_none_log
+def get_color_shift_df(spectral_profile):
+    return spectral_profile.color_shift_df
+
+@except_none_log
+def get_brightness_loss_df(spectral_profile):
+    return spectral_profile.brightness_loss_df
+
+
+def get_crossovers(df, thresholds):
+    """
+    Find every point where each column of df crosses each of thresholds, interpolating linearly in df's index.
+    Returns one row per crossing with its threshold, column, direction ('falling' or 'rising') and x,
+    ordered by threshold (in the order given), column and x.
+    """
+    x = df.index.values.astype(float)
+    y = df.values.astype(float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    above = y > thresholds[:, None, None]
+    below = y < thresholds[:, None, None]
+    falling = above[:, :-1] & below[:, 1:]
+    rising = below[:, :-1] & above[:, 1:]
+    k, i, j = np.nonzero(falling | rising)
+    order = np.lexsort((i, j, k))
+    k, i, j = k[order], i[order], j[order]
+    is_falling = falling[k, i, j]
+    # interpolate from the point above the threshold to its neighbour below
+    i1 = np.where(is_falling, i, i + 1)
+    i2 = np.where(is_falling, i + 1, i)
+    slope = (y[i2, j] - y[i1, j]) / (x[i2] - x[i1])
+    return pd.DataFrame({
+        'threshold': thresholds[k],
+        'column': df.columns[j],
+        'direction': np.where(is_falling, 'falling', 'rising'),
+        'x': x[i1] + (thresholds[k] - y[i1, j]) / slope,
+    })
+
+
+def get_first_crossovers(df, thresholds):
+    """
+    Return the x of the first falling crossing of each threshold by each column of df, or of the first rising
+    crossing if there is no falling one, keyed by threshold then column (None if the column never crosses).
+    """
+    crossovers = get_crossovers(df, thresholds).sort_values('direction', kind='mergesort')
+    first = crossovers.drop_duplicates(subset=['threshold', 'column']).set_index(['threshold', 'column'])['x']
+    return {threshold: {col: first.get((threshold, col)) for col in df.columns} for threshold in thresholds}
 
 @except_none_log
 def get_washout_crossovers(washout_df):
-    crossovers = {}
-    for col in washout_df.columns:
-        crossovers[col] = get_crossover_x(series=washout_df[col], crossover_y=.8)
-    return crossovers
+    return get_first_crossovers(washout_df, [.8])[.8]
 
 @except_none_log
 def get_color_shift_crossovers(color_shift_df):
-    pos_crossovers = {}
-    for col in color_shift_df.columns:
-        pos_crossovers[col] = get_crossover_x(series=color_shift_df[col], crossover_y=3)
-    neg_crossovers = {}
-    for col in color_shift_df.columns:
-        neg_crossovers[col] = get_crossover_x(series=color_shift_df[col], crossover_y=-3)
-    crossovers = {
-        'positive': pos_crossovers,
-        'negative': neg_crossovers
+    crossovers = get_first_crossovers(color_shift_df, [3, -3])
+    return {
+        'positive': crossovers[3],
+        'negative': crossovers[-3]
     }
-    return crossovers
 
 @except_none_log
 def get_brightness_loss_crossover(brightness_loss_df):
-    return get_crossover_x(series=brightness_loss_df['White'], crossover_y=.75)
-    
+    return get_first_crossovers(brightness_loss_df[['White']], [.75])[.75]['White']
+
+def polygon_area(points):
+    """Signed area of a polygon given its vertices as an (n, 2) array, positive if they run counterclockwise."""
+    x, y = points[:, 0], points[:, 1]
+    return (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+
+def clip_polygon(subject, clip):
+    """Intersect polygon subject with convex polygon clip (Sutherland-Hodgman), both given as (n, 2) arrays."""
+    if polygon_area(clip) < 0:
+        clip = clip[::-1]
+    points = list(subject)
+    for a, b in zip(clip, np.roll(clip, -1, axis=0)):
+        if not points:
+            break
+        edge = b - a
+        # positive on the inside (left) of the clip edge
+        sides = [edge[0] * (p[1] - a[1]) - edge[1] * (p[0] - a[0]) for p in points]
+        clipped = []
+        for i in range(len(points)):
+            p, q = points[i - 1], points[i]
+            sp, sq = sides[i - 1], sides[i]
+            if (sp >= 0) != (sq >= 0):
+                clipped.append(p + (q - p) * sp / (sp - sq))
+            if sq >= 0:
+                clipped.append(q)
+        points = clipped
+    return np.array(points).reshape(-1, 2)
+
+
 @except_none_log
 def get_coverage(coordinates_df, colorspace):
-    def point_on_triangle(pt1, pt2, pt3):
-        """Random point on the triangle with vertices pt1, pt2 and pt3."""
-        s, t = sorted([random.random(), random.random()])
-        return (s * pt1[0] + (t - s) * pt2[0] + (1 - t) * pt3[0],
-                s * pt1[1] + (t - s) * pt2[1] + (1 - t) * pt3[1])
-    
-    def isInside(x1, y1, x2, y2, x3, y3, x, y):
-        """A function to check whether point P(x, y) lies inside the triangle formed by A(x1, y1), B(x2, y2) and C(x3, y3)"""
-        
-        def area(x1, y1, x2, y2, x3, y3):
-            """A utility function to calculate area of triangle formed by (x1, y1), (x2, y2), and (x3, y3)"""
-            return abs((x1 * (y2 - y3) + x2 * (y3 - y1) + x3 * (y1 - y2)) / 2.0)
-            # Calculate area of triangle ABC
-        
-        A = area(x1, y1, x2, y2, x3, y3)
-        # Calculate area of triangle PBC
-        A1 = area(x, y, x2, y2, x3, y3)
-        # Calculate area of triangle PAC
-        A2 = area(x1, y1, x, y, x3, y3)
-        # Calculate area of triangle PAB
-        A3 = area(x1, y1, x2, y2, x, y)
-        # Check if sum of A1, A2 and A3
-        # is same as A (rounding to avoid inequalities caused by floating point arithmetic)
-        if round(A, 10) == round(A1 + A2 + A3, 10):
-            return True
-        else:
-            return False
-    
-    x1, y1, x2, y2, x3, y3 = coordinates_df[['Red', 'Green', 'Blue']].T.values.ravel()
-    total, inside_total = 0, 0
-    for _ in range(100000):
-        x, y = point_on_triangle(*colorspace._primaries)
-        inside_total += isInside(x1, y1, x2, y2, x3, y3, x, y)
-        total += 1
-    return inside_total / total
+    """
+    Fraction of colorspace's gamut (CIE 1931 xy) covered by the gamut of the measured primaries.
+    colorspace is a colour RGB colourspace or the name of one in colour.RGB_COLOURSPACES (e.g. 'DCI-P3').
+    """
+    if isinstance(colorspace, str):
+        colorspace = RGB_COLOURSPACES[colorspace]
+    measured = coordinates_df[['Red', 'Green', 'Blue']].T.values.astype(float)
+    primaries = np.asarray(colorspace.primaries, dtype=float)
+    return abs(polygon_area(clip_polygon(primaries, measured))) / abs(polygon_area(primaries))
 
 @except_none_log
 def get_lum_df(paths):
@@ -577,55 +623,140 @@ def get_3bar_lum_df(paths):
     return pd.read_csv(paths['bar3_lum'])
 
 
-def get_report_data(paths, data_folder, docopt_args):
-    data = {}
-    data['data_folder'] = data_folder
-    data['report_type'] = get_report_type(docopt_args, data_folder)
-    data['test_seq_df'] = get_test_seq_df(paths)
-    data['merged_df'] = get_merged_df(data['test_seq_df'], paths, data_folder)
-    data['hdr'] = get_hdr(data['merged_df'])
-    data['limit_funcs'] = get_limit_funcs(data['report_type'])
-    data['setup_img_paths'] = get_setup_img_paths(paths, data_folder)
-    data['bar3_lum_df'] = get_3bar_lum_df(paths)
-    if data['report_type']=='pcl':
-        data['persistence_dfs'] = get_persistence_dfs(paths)
-        data['spectral_df'] = get_spectral_df(paths)
-        data['scdf'] = get_spectral_coordinates_df(paths)
-        data['bt2020_coverage'] = get_coverage(data['scdf'], BT2020_COLOURSPACE)
-        data['bt709_coverage'] = get_coverage(data['scdf'], BT709_COLOURSPACE)
-        data['washout_df'] = get_washout_df(paths)
-        data['washout_crossovers'] = get_washout_crossovers(data['washout_df'])
-        data['color_shift_df'] = get_color_shift_df(paths)
-        data['color_shift_crossovers'] = get_color_shift_crossovers(data['color_shift_df'])
-        data['brightness_loss_df'] = get_brightness_loss_df(paths)
-        data['brightness_loss_crossover'] = get_brightness_loss_crossover(data['brightness_loss_df'])
-        data['contrast_ratio'] = get_contrast_ratio(paths)
-        data['spectral_summary_df'] = get_spectral_summary_df(data)
+def pcl_only(func):
+    """Compute a report item only for PCL reports, other report types get None."""
+    def wrapper(report_type, *args):
+        return func(*args) if report_type == 'pcl' else None
+    return wrapper
+
+
+# each report data item's function and the items passed to it
+REPORT_ITEMS = {
+    'report_type': (get_report_type, ['docopt_args', 'data_folder']),
+    'chunksize': (lambda docopt_args: docopt_args.get('--chunksize'), ['docopt_args']),
+    'test_seq_df': (get_test_seq_df, ['paths']),
+    'merged_df': (get_merged_df, ['test_seq_df', 'paths', 'data_folder', 'chunksize']),
+    'hdr': (get_hdr, ['merged_df']),
+    'limit_funcs': (get_limit_funcs, ['report_type']),
+    'setup_img_paths': (get_setup_img_paths, ['paths', 'data_folder']),
+    'bar3_lum_df': (get_3bar_lum_df, ['paths']),
+    'persistence_dfs': (pcl_only(get_persistence_dfs), ['report_type', 'paths']),
+    'spectral_profile': (pcl_only(get_spectral_profile), ['report_type', 'paths']),
+    'spectral_df': (pcl_only(get_spectral_df), ['report_type', 'spectral_profile']),
+    'scdf': (pcl_only(get_spectral_coordinates_df), ['report_type', 'spectral_profile']),
+    'bt2020_coverage': (pcl_only(partial(get_coverage, colorspace=BT2020_COLOURSPACE)), ['report_type', 'scdf']),
+    'bt709_coverage': (pcl_only(partial(get_coverage, colorspace=BT709_COLOURSPACE)), ['report_type', 'scdf']),
+    'washout_df': (pcl_only(get_washout_df), ['report_type', 'spectral_profile']),
+    'washout_crossovers': (pcl_only(get_washout_crossovers), ['report_type', 'washout_df']),
+    'color_shift_df': (pcl_only(get_color_shift_df), ['report_type', 'spectral_profile']),
+    'color_shift_crossovers': (pcl_only(get_color_shift_crossovers), ['report_type', 'color_shift_df']),
+    'brightness_loss_df': (pcl_only(get_brightness_loss_df), ['report_type', 'spectral_profile']),
+    'brightness_loss_crossover': (pcl_only(get_brightness_loss_crossover), ['report_type', 'brightness_loss_df']),
+    'contrast_ratio': (pcl_only(get_contrast_ratio), ['report_type', 'paths']),
+    'spectral_summary_df': (pcl_only(get_spectral_summary_df), ['report_type', 'bt2020_coverage', 'bt709_coverage',
+                                                                'contrast_ratio', 'brightness_loss_crossover',
+                                                                'washout_crossovers', 'color_shift_crossovers',
+                                                                'data_folder']),
+    'waketimes': (get_waketimes, ['merged_df']),
+    'rsdf': (get_results_summary_df, ['merged_df', 'data_folder', 'waketimes']),
+    'test_specs_df': (get_test_specs_df, ['merged_df', 'paths', 'report_type']),
+    'test_date': (get_test_date, ['test_specs_df']),
+    'area': (get_screen_area, ['test_specs_df']),
+    'model': (get_model, ['test_specs_df']),
+    'on_mode_df': (get_on_mode_df, ['rsdf', 'limit_funcs', 'area', 'report_type', 'hdr']),
+    'standby_df': (get_standby_df, ['rsdf']),
+    'status_df': (get_status_df, ['test_seq_df', 'merged_df', 'paths', 'data_folder']),
+    'lum_df': (get_lum_df, ['paths']),
+    'csdf': (get_compliance_summary_df, ['on_mode_df', 'standby_df', 'report_type', 'hdr']),
+}
+
+# items whose functions may show a popup (see permission_popup), which PySimpleGUI only allows on the main thread
+MAIN_THREAD_ITEMS = {'test_seq_df', 'merged_df', 'rsdf', 'status_df', 'contrast_ratio', 'spectral_summary_df'}
+
+
+class ReportData(Mapping):
+    """
+    Report data items which are computed (along with the items they depend on) the first time they are accessed
+    so each report only pays for the items its sections use. Pass items to a report section with
+    section(report, **report_data.args(section)) rather than **report_data, which would compute every item.
+    load computes the items a report needs up front, running independent items concurrently.
+    """
+    def __init__(self, paths, data_folder, docopt_args, funcs=REPORT_ITEMS):
+        self.funcs = funcs
+        self.data = {'paths': paths, 'data_folder': data_folder, 'docopt_args': docopt_args}
+
+    def __getitem__(self, key):
+        if key not in self.data:
+            if key not in self.funcs:
+                raise KeyError(key)
+            for dep in self.funcs[key][1]:
+                self[dep]
+            self.data[key] = self.compute(key)
+        return self.data[key]
+
+    def compute(self, key):
+        """Compute an item whose dependencies have been computed."""
+        func, deps = self.funcs[key]
+        return func(*[self.data[dep] for dep in deps])
+
+    def missing(self, keys):
+        """Return keys and the items they depend on which haven't been computed yet."""
+        missing = set()
+        while keys:
+            key = keys.pop()
+            if key not in self.data and key not in missing:
+                if key not in self.funcs:
+                    raise KeyError(key)
+                missing.add(key)
+                keys.extend(self.funcs[key][1])
+        return missing
+
+    def load(self, *keys, max_workers=None):
+        """
+        Compute keys (every item if none are given) and the items they depend on. Items whose dependencies
+        have been computed run concurrently on a thread pool, except MAIN_THREAD_ITEMS which run on this thread
+        while the pool works on the others.
+        """
+        pending = self.missing(list(keys or self.funcs))
+        running = {}
+        with ThreadPoolExecutor(max_workers) as executor:
+            while pending or running:
+                ready = [key for key in pending if all(dep in self.data for dep in self.funcs[key][1])]
+                for key in ready:
+                    if key not in MAIN_THREAD_ITEMS:
+                        pending.remove(key)
+                        running[executor.submit(self.compute, key)] = key
+                main_ready = [key for key in ready if key in MAIN_THREAD_ITEMS]
+                if main_ready:
+                    pending.remove(main_ready[0])
+                    self.data[main_ready[0]] = self.compute(main_ready[0])
+                    done = [future for future in running if future.done()]
+                else:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.data[running.pop(future)] = future.result()
+        return self
+
+    def __contains__(self, key):
+        return key in self.data or key in self.funcs
+
+    def __setitem__(self, key, value):
+        """Override an item. Items already computed from its previous value are kept."""
+        self.data[key] = value
+
+    def __iter__(self):
+        return iter(list(self.data) + [key for key in self.funcs if key not in self.data])
+
+    def __len__(self):
+        return len(set(self.data) | set(self.funcs))
+
+    def args(self, func):
+        """Return the items named by func's parameters as keyword arguments."""
+        return {name: self[name] for name in inspect.signature(func).parameters if name in self}
 
-    else:
-        data['persistence_dfs'] = None
-        data['spectral_df'] = None
-        data['scdf'] = None
-        data['washout_df'] = None
-        data['washout_crossovers'] = None
-        data['color_shift_df'] = None
-        data['color_shift_crossovers'] = None
-        data['brightness_loss_df'] = None
-        data['brightness_loss_crossover'] = None
-    data['waketimes'] = get_waketimes(data['merged_df'])
-    data['rsdf'] = get_results_summary_df(data['merged_df'], data_folder, data['waketimes'])
-    data['test_specs_df'] = get_test_specs_df(data['merged_df'], paths, data['report_type'])
-    data['test_date'] = get_test_date(data['test_specs_df'])
-    data['area'] = get_screen_area(data['test_specs_df'])
-    data['model'] = get_model(data['test_specs_df'])
-    data['on_mode_df'] = get_on_mode_df(data['rsdf'], data['limit_funcs'], data['area'], data['report_type'], data['hdr'])
-    data['standby_df'] = get_standby_df(data['rsdf'])
-    data['status_df'] = get_status_df(data['test_seq_df'], data['merged_df'], paths, data['data_folder'])
-    data['lum_df'] = get_lum_df(paths)
-    data['csdf'] = get_compliance_summary_df(data['on_mode_df'], data['standby_df'], data['report_type'], data['hdr'])
-    
-    
-    return data
+
+def get_report_data(paths, data_folder, docopt_args):
+    return ReportData(paths, data_folder, docopt_args)
 
 
 def check_report_data(report_data, expected_data):
@@ -0,0 +1,77 @@
+"""Column types of the datalog, merged data and APL csv files so pandas doesn't have to infer them."""
+import pandas as pd
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = None
+
+
+DATALOG_COLS = ['Timestamp', 'Power', 'Luminance', 'Tag']
+DATALOG_DTYPES = {
+    'Power': 'float32',
+    'Luminance': 'float32',
+    'Tag': 'category',
+}
+
+# tag stays float64 so stabilization tags (2.1, 2.2...) compare equal to the test sequence's tags
+MERGED_DTYPES = {
+    'watts': 'float32',
+    'nits': 'float32',
+    'tag': 'float64',
+    "APL'": 'float32',
+    'R': 'float32',
+    'G': 'float32',
+    'B': 'float32',
+}
+
+APL_DTYPES = {
+    'seconds': 'int32',
+    "APL'": 'float32',
+    'R': 'float32',
+    'G': 'float32',
+    'B': 'float32',
+}
+
+
+def read_datalog_csv(filepath_or_buffer, usecols=DATALOG_COLS, **kwargs):
+    """Parse datalog csv data keeping only the columns in usecols (other columns a datalog may have are skipped)."""
+    parse_dates = ['Timestamp'] if 'Timestamp' in usecols else False
+    return pd.read_csv(filepath_or_buffer, usecols=lambda col: col in usecols, dtype=DATALOG_DTYPES,
+                       parse_dates=parse_dates, infer_datetime_format=True, **kwargs)
+
+
+def read_datalog_arrow(path, usecols=DATALOG_COLS):
+    """
+    Parse a datalog csv file with pyarrow's multi-threaded csv reader, giving the same columns and types
+    as read_datalog_csv. Timestamps are parsed as ISO 8601 (2020-05-01 08:00:00.474) without inference.
+    """
+    arrow_types = {
+        'Timestamp': pa.timestamp('ns'),
+        'Power': pa.float32(),
+        'Luminance': pa.float32(),
+        'Tag': pa.dictionary(pa.int32(), pa.string()),
+    }
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=[col for col in read_header(path) if col in usecols],
+        column_types={col: arrow_types[col] for col in usecols},
+        timestamp_parsers=[pa_csv.ISO8601],
+        strings_can_be_null=True,
+    )
+    read_options = pa_csv.ReadOptions(use_threads=True)
+    return pa_csv.read_csv(path, read_options=read_options, convert_options=convert_options).to_pandas()
+
+
+def read_header(path):
+    """Return the column names of a csv file."""
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_merged_csv(filepath_or_buffer, **kwargs):
+    """Parse merged data csv."""
+    return pd.read_csv(filepath_or_buffer, dtype=MERGED_DTYPES, parse_dates=['time'], infer_datetime_format=True, **kwargs)
+
+
+def read_apl_csv(filepath_or_buffer):
+    """Parse an APL table csv."""
+    return pd.read_csv(filepath_or_buffer, dtype=APL_DTYPES)
@@ -0,0 +1,93 @@
+"""Spectral profile and viewing angle measurements (*viewing*.csv) parsed once for all of the report's views of them."""
+from functools import wraps
+import numpy as np
+import pandas as pd
+from colour import XYZ_to_Lab, Lab_to_LCHab
+
+
+# row positions of each block of measurements in the profile (after the header)
+XYZ_ROWS = slice(12, 15)
+CHROMATICITY_ROWS = slice(18, 20)
+SPECTRUM_START = 39
+
+
+def view(method):
+    """Make method a property which is computed the first time it is read and cached after that."""
+    @wraps(method)
+    def wrapper(self):
+        if method.__name__ not in self.views:
+            self.views[method.__name__] = method(self)
+        return self.views[method.__name__]
+    return property(wrapper)
+
+
+class SpectralProfile:
+    """
+    Measurements of each color (White, Red, Green, Blue) at each viewing angle, with columns named
+    <color>(<angle>): the power spectrum, the CIE 1931 xy chromaticity and the XYZ tristimulus values.
+    """
+    def __init__(self, profile_df):
+        profile_df = profile_df.set_index(profile_df.columns[0])
+        profile_df.index.name = ''
+        self.spectrum = profile_df.iloc[SPECTRUM_START:].astype(float)
+        self.spectrum.index = self.spectrum.index.astype(float)
+        self.chromaticity = profile_df.iloc[CHROMATICITY_ROWS].astype(float)
+
+        xyz = profile_df.iloc[XYZ_ROWS].T.astype(float)
+        self.xyz = xyz.set_index([
+            xyz.index.str.split('(').str[0].str.strip().rename('color'),
+            xyz.index.str.split('(').str[1].str.replace(')', '', regex=False).astype(int).rename('angle'),
+        ])
+        self.views = {}
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls(pd.read_csv(path))
+
+    @view
+    def spectral_df(self):
+        """Power spectrum of each color at the first angle."""
+        df = self.spectrum[self.spectrum.columns[:4]]
+        df.columns = [col.split('(')[0].strip() for col in df.columns]
+        df.index.name = 'Wavelength (nm)'
+        return df
+
+    @view
+    def coordinates_df(self):
+        """xy chromaticity of the primaries at 0 degrees."""
+        df = self.chromaticity[['Red(0)', 'Green(0)', 'Blue(0)']]
+        df.columns = ['Red', 'Green', 'Blue']
+        return df.reset_index()
+
+    @view
+    def norm_xyz(self):
+        """XYZ relative to the first measurement (white at 0 degrees), capped at 1."""
+        return np.minimum(self.xyz / self.xyz.iloc[0], 1)
+
+    @view
+    def lchab(self):
+        """CIE LCHab lightness, chroma and hue of each color and angle."""
+        lchab = Lab_to_LCHab(XYZ_to_Lab(self.norm_xyz.values))
+        return pd.DataFrame(lchab, index=self.norm_xyz.index, columns=['l', 'c', 'h'])
+
+    @view
+    def washout_df(self):
+        """Chroma of each primary relative to its chroma at the first angle, capped at 1."""
+        df = by_angle(self.lchab['c'])
+        return np.minimum(df / df.iloc[0], 1).drop('White', axis=1)
+
+    @view
+    def color_shift_df(self):
+        """Hue of each primary relative to its hue at the first angle."""
+        df = by_angle(self.lchab['h'])
+        return (df - df.iloc[0]).drop('White', axis=1)
+
+    @view
+    def brightness_loss_df(self):
+        """White's relative luminance at each angle."""
+        return by_angle(self.norm_xyz['Y'])[['White']]
+
+
+def by_angle(series):
+    """Pivot a series indexed by color and angle to one row per angle and one column per color."""
+    return series.unstack('color').rename_axis(columns=None)
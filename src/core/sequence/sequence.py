@@ -1,17 +1,16 @@
 """Functions used in multiple test sequence scripts."""
-import sys
 from datetime import datetime
 import pandas as pd
 from pathlib import Path
 from ..filefuncs import archive, APPDATA_DIR
 from ..error_handling import permission_popup
+from ..config import get_config, memoize
 
 
+@memoize
 def get_tests():
     """Construct dictionary of all possible tests from csv file."""
-    path = Path(sys.path[0]).joinpath(r'config\test-details.csv')
-    
-    df = pd.read_csv(path).T
+    df = get_config('test_details').T
     df.columns = df.iloc[0]
     tests = df.to_dict()
     return tests
@@ -10,13 +10,15 @@ sys.path.append('..')
 import filefuncs as ff
 import logfuncs as lf
 from error_handling import permission_popup
+from core.report.merge import parse_tags
 
 
 def get_repair_df(path):
     df = pd.read_csv(path)
-    mask = (df['Tag'].apply(lambda tag: 'repair' in tag)) & (df['Tag'].apply(lambda tag: 'user command' not in tag))
+    mask = parse_tags(df['Tag'], lambda tag: 'repair' in str(tag) and 'user command' not in str(tag))
+    mask = mask.fillna(False).astype(bool)
     repair_df = df[mask].copy()
-    repair_df['Tag'] = repair_df['Tag'].apply(lambda tag: tag.replace('repair', '').strip())
+    repair_df['Tag'] = parse_tags(repair_df['Tag'], lambda tag: tag.replace('repair', '').strip())
     repair_df['source'] = str(path.stem)
     return repair_df
 
@@ -20,11 +20,11 @@ def make_lum_report(report_data):
     report = ISection(name='report')
     # add test specifications to report if available
     if report_data['test_specs_df'] is not None:
-        report = add_test_specs(report, **report_data)
+        report = add_test_specs(report, **report_data.args(add_test_specs))
     with report.new_section('Light Directionality', page_break=False) as ld:
-        ld = add_light_directionality(ld, numbering=False, **report_data)
+        ld = add_light_directionality(ld, numbering=False, **report_data.args(add_light_directionality))
     report_name = f'lum-report.pdf'
-    build_report(report, report_name, **report_data)
+    build_report(report, report_name, **report_data.args(build_report))
 
 
 def main():
@@ -43,6 +43,7 @@ def main():
         'lum_df',
         'test_specs_df'
     ]
+    report_data.load(*expected_data)
     check_report_data(report_data, expected_data)
     make_lum_report(report_data)
 
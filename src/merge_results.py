@@ -7,15 +7,17 @@ Arguments:
   
 Options:
   -h --help
+  --chunksize=<rows>  read the datalog in chunks of this many rows to limit memory use
 """
 import core.logfuncs as lf
 import core.filefuncs as ff
-from core.report.report_data import get_merged_df
+from core.report.report_data import get_merged_df, get_test_seq_df
 
 def main():
     logger, docopt_args, data_folder = lf.start_script(__doc__, 'merge_results.log')
     paths = ff.get_paths(data_folder)
-    get_merged_df(paths, data_folder)
+    test_seq_df = get_test_seq_df(paths)
+    get_merged_df(test_seq_df, paths, data_folder, docopt_args['--chunksize'], load=False)
 
 
 if __name__ == '__main__':
@@ -19,11 +19,11 @@ def make_overlay_report(report_data, test_names):
     report = ISection(name='report')
     # add test specifications to report if available
     if report_data['test_specs_df'] is not None:
-        report = add_test_specs(report, **report_data)
+        report = add_test_specs(report, **report_data.args(add_test_specs))
     with report.new_section('Overlay Chart') as oc:
-        oc = add_overlay(oc, test_names=test_names, **report_data)
+        oc = add_overlay(oc, test_names=test_names, **report_data.args(add_overlay))
     report_name = f'overlay-{test_names[0]}-{test_names[1]}.pdf'
-    build_report(report, report_name, **report_data)
+    build_report(report, report_name, **report_data.args(build_report))
 
 
 def main():
@@ -33,9 +33,10 @@ def main():
     report_data = get_report_data(paths, data_folder, docopt_args)
     expected_data = [
         'rsdf',
-        'merged_df'
+        'merged_df',
         'test_specs_df'
     ]
+    report_data.load(*expected_data)
     check_report_data(report_data, expected_data)
     make_overlay_report(report_data, test_names)
     
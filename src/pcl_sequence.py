@@ -12,6 +12,7 @@ import core.sequence.sequence as ts
 import core.sequence.command_sequence as cs
 import core.logfuncs as lf
 from core.error_handling import error_popup
+from core.entry_forms import read_sheet
 
 
 blank_entry_msg = lambda path, entry: f'Error in {path}\n\n"{entry}" cannot be blank.\nPress OK when error has been corrected.\nRemember to save.'
@@ -99,7 +100,7 @@ def get_pps_df(path):
         'pps12': 'pps12'
     }
     
-    df = pd.read_excel(path, sheet_name='PPS', index_col=0)
+    df = read_sheet(path, 'PPS', index_col=0)
     df = df.dropna(subset=['PPS Name']).replace({'y': True, 'n': False})
     
     for pps in ['Default SDR PPS', 'Brightest SDR PPS']:
@@ -115,7 +116,7 @@ def get_pps_df(path):
     
     
 def get_qsinfo(path):
-    df = pd.read_excel(path, sheet_name='Misc', index_col=0)
+    df = read_sheet(path, 'Misc', index_col=0)
     df.columns = ['entry']
     df['entry'] = df['entry'].astype(object)
     df = df.replace({'Yes': True, 'No': False})
@@ -9,6 +9,7 @@ Options:
   -e            force ENERGYSTAR report type
   -v            force VA report type
   -p            force PCL report type
+  --chunksize=<rows>  read the datalog in chunks of this many rows to limit memory use
 """
 import sys
 from pathlib import Path
@@ -23,19 +24,21 @@ import core.report.report_data as rd
 import core.logfuncs as lf
 import core.filefuncs as ff
 from core.error_handling import skip_and_warn
+from core.config import get_config, memoize
+
+
+@memoize
+def get_intro_text():
+    """Intro text keyed by the node path ("/" separators) of the report section it belongs to."""
+    return get_config('intro_text')['text'].replace({np.nan: None}).to_dict()
 
 
 class ISection(rls.Section):
     """rls.Sections subclass to allow adding introductory text (text at beginning of a section) from external file"""
-    
-    # read intro text csv into dictionary and save as class variable
-    # intro_text keys (first column of csv) should be node path ("/" separators) to desired report section
-    intro_text = pd.read_csv(Path(sys.path[0]).joinpath(r'config\intro-text.csv'), index_col='section_path')['text'].replace(
-        {np.nan: None}).to_dict()
 
     def insert_intro_text(self):
         """Check if intro text exists for current section and insert as element."""
-        text = self.intro_text.get(self.path_str)
+        text = get_intro_text().get(self.path_str)
         if text:
             self.create_element('intro_text', text)
 
@@ -455,7 +458,8 @@ def add_overlay(report, rsdf, merged_df, test_names, **kwargs):
 
 @skip_and_warn
 def add_supplemental(report, rsdf, merged_df, hdr, lum_df, spectral_df, scdf, report_type, washout_df, washout_crossovers,
-                     color_shift_df, color_shift_crossovers, brightness_loss_df, brightness_loss_crossover, **kwargs):
+                     color_shift_df, color_shift_crossovers, brightness_loss_df, brightness_loss_crossover,
+                     bt2020_coverage=None, bt709_coverage=None, **kwargs):
     with report.new_section('Supplemental Test Results', page_break=False) as supp:
         with supp.new_section('Stabilization') as stab:
             stab_tests = [test for test in rsdf.test_name.unique() if 'stabilization' in test]
@@ -478,7 +482,7 @@ def add_supplemental(report, rsdf, merged_df, hdr, lum_df, spectral_df, scdf, re
                     spd.create_element('cheap page break', '<br /><br /><br /><br /><br /><br /><br /><br /><br /><br />')
                     spd.create_element('chromaticity plot', plots.chromaticity(spectral_df))
                     spd.create_element('spectral coordinates table', scdf)
-                    text = f" BT.2020 Colorspace Coverage: {100*kwargs['bt2020_coverage']:.0f}%<br /> BT.709 Colorspace Coverage: {100*kwargs['bt709_coverage']:.0f}%"
+                    text = f" BT.2020 Colorspace Coverage: {100*bt2020_coverage:.0f}%<br /> BT.709 Colorspace Coverage: {100*bt709_coverage:.0f}%"
                     spd.create_element('coverage', text)
             add_spectral_power_distribution(report)
             @skip_and_warn
@@ -578,15 +582,15 @@ def build_report(report,  filename, data_folder, model, test_date, report_title=
 def make_report(report_data):
     """Create the pdf report from the test data."""
     report = ISection(name='report')
-    report = add_test_specs(report, **report_data)
+    report = add_test_specs(report, **report_data.args(add_test_specs))
     if report_data['report_type'] == 'pcl':
-        report = add_persistence_summary(report, **report_data)
+        report = add_persistence_summary(report, **report_data.args(add_persistence_summary))
     
-    report = add_compliance_section(report, **report_data)
-    report = add_supplemental(report, **report_data)
-    report = add_test_results_table(report, **report_data)
-    report = add_test_results_plots(report, **report_data)
-    report = add_appendix(report, **report_data)
+    report = add_compliance_section(report, **report_data.args(add_compliance_section))
+    report = add_supplemental(report, **report_data.args(add_supplemental))
+    report = add_test_results_table(report, **report_data.args(add_test_results_table))
+    report = add_test_results_plots(report, **report_data.args(add_test_results_plots))
+    report = add_appendix(report, **report_data.args(add_appendix))
     filename = {'estar': 'ENERGYSTAR-report.pdf',
                    'alternative': 'va-report.pdf',
                    'pcl': 'pcl-report.pdf'}.get(report_data['report_type'])
@@ -603,6 +607,7 @@ def main():
         rd.get_ccf_df(merged_df, data_folder)
     else:
         report_data = rd.get_report_data(paths, data_folder, docopt_args)
+        report_data.load()
         ISection.save_content_dir = Path(data_folder).joinpath('Elements')
         make_report(report_data)
 
@@ -7,6 +7,7 @@ Arguments:
 
 Options:
   -h --help
+  --chunksize=<rows>  read the datalog in chunks of this many rows to limit memory use
 """
 import pandas as pd
 import core.report.report_data as rd
@@ -19,9 +20,11 @@ def main():
     paths = ff.get_paths(data_folder)
 
     test_seq_df = pd.read_csv(paths['test_seq'])
-    merged_df = rd.get_merged_df(test_seq_df, paths, data_folder)
+    # the status only needs the per test table so the merged data isn't loaded
+    rd.get_merged_df(test_seq_df, paths, data_folder, docopt_args['--chunksize'], load=False)
+    tests_df = rd.get_tests_df(data_folder)
     
-    rd.get_status_df.__wrapped__(test_seq_df, merged_df, paths, data_folder)
+    rd.get_status_df.__wrapped__(test_seq_df, tests_df, paths, data_folder)
     
     
 if __name__ == '__main__':